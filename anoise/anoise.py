@@ -17,20 +17,21 @@
 # along with ANoise; if not, see http://www.gnu.org/licenses
 # for more information.
 
-import gi, os, threading
+import gi, os, sys, time, signal, argparse, collections
 from six.moves import urllib
-gi.require_version('Gtk', '3.0')
 gi.require_version('Gst', '1.0')
-gi.require_version('Keybinder', '3.0')
-from gi.repository import Gtk, GLib, GObject, Gst, Keybinder
+from gi.repository import GLib, GObject, Gst # Gtk and Keybinder only with a desktop, not headless
 from dbus.mainloop.glib import DBusGMainLoop
 from utils import *
 from sound_menu import SoundMenuControls
-from preferences import Preferences
-try:
-    from view import GUI
-except ImportError:
-    pass
+from cache import PCMCache, Prefetcher
+from mixer import Mixer
+from generators import GeneratedSource, is_generated, get_color
+from looppoints import LoopPoints
+from stats import Stats
+from stream import StreamServer, make_audio_sink
+from scheduler import Scheduler
+import power, archive
 
 # i18n
 import gettext
@@ -49,17 +50,126 @@ else:
 
 class ANoise:
     """Control the sound indicator"""
-    def __init__(self):
+    def __init__(self, headless=False, stream_port=None, power_profile=None):
         # These 3 are needed
         GObject.threads_init()
         DBusGMainLoop(set_as_default=True)
         Gst.init(None)
         GLib.set_application_name(_('Ambient Noise'))
         self.sound_menu = SoundMenuControls('Ambient Noise', 'anoise')
-        self.noise = Noise()
-        self.win_preferences = Preferences(self)
+        self.noise = Noise(watch=False) # Watching starts after the first noise plays
+        self.pcm_cache = PCMCache(self.noise.get_hash)
+        self.prefetcher = Prefetcher(self.pcm_cache)
+        self.loop_points = LoopPoints()
+        self.noise.on_changed = self._on_noises_changed
+        self.noise.on_gain = self._on_gain
+        self.stats = Stats()
+        self.scheduler = Scheduler() # Sleep timer, wake up and scheduled noise changes
+        self.volume = 1.0
+        self.FADE_OUT = 30 # Seconds, for the sleep timer
+        self.FADE_IN = 60  # Seconds, for the wake up
+        if power_profile is None:
+            power_profile = self.noise.state.get('power_profile', power.DEFAULT)
+        self.power_profile = power_profile # Used by the sinks and sources made from now on
+        self.win_preferences = None # Built the first time it's raised
+        self.headless = headless # No GTK at all: no media keys, window or preferences
+        if headless:
+            self.keybinder = None
+            self.sound_menu._set_properties('org.mpris.MediaPlayer2', CanRaise=False)
+        else:
+            self._init_desktop()
+
+        self.player = Gst.ElementFactory.make(PLAYBIN, "player")
+        self.player.connect("about-to-finish", self._loop)
+        self.player.connect("source-setup", self._on_source_setup)
+        # Skip latency: from next/previous until the first sample of the new noise
+        self.SKIP_LATENCY_TARGET = 0.1
+        self.skip_latencies = collections.deque(maxlen=100)
+        self._skip_started = None
+        self.audio_filter = Gst.ElementFactory.make('volume', None)
+        self._buffer_probe = None # Only until the first audio, and again while a skip is measured
+        self._watch_player_buffers()
+        # Loops are queued from the streaming thread as the segment ends, never through the main loop
+        self.audio_filter.get_static_pad('src').add_probe(Gst.PadProbeType.EVENT_DOWNSTREAM, self._on_player_event)
+        self.player.set_property('audio-filter', self.audio_filter)
+        # Other rooms: the output is also encoded once and served to every listener
+        self.stream = None
+        if stream_port is not None:
+            self.stream = StreamServer(stream_port)
+            self.stream.start()
+        self.player.set_property('audio-sink', make_audio_sink(self.stream, profile=self.power_profile))
+        # Gapless loop: keep the decoder alive and jump back with segment seeks
+        self.segment_loop = True
+        self._segment_pending = False
+        self._segment_looping = False
+        self._segment = (0, -1)
+        self._loaded = False
+        self.is_playing = False
+        bus = self.player.get_bus()
+        bus.add_signal_watch()
+        bus.connect('message::async-done', self._on_async_done)
+        self.stats.watch(self.player)
+        # Layers: with more than one noise the playbin gives way to the mixer
+        self.crossfade = 0 # Seconds to crossfade next/previous, it needs the mixer too
+        self.mixer = None
+        self._main_layer = None
+        self._layers = {}
+
+        dummy_i18n = (_("Coffee Shop"), _("Fire"), _("Forest"), _("Night"), _("Rain"), _("River"), _("Sea"), _("Storm"), _("Wind")) # Need i18n
 
+        # Overwrite libraty methods
+        self.sound_menu._sound_menu_is_playing = self._sound_menu_is_playing
+        self.sound_menu._sound_menu_play       = self._sound_menu_play
+        self.sound_menu._sound_menu_pause      = self._sound_menu_pause
+        self.sound_menu._sound_menu_next       = self._sound_menu_next
+        self.sound_menu._sound_menu_previous   = self._sound_menu_previous
+        self.sound_menu._sound_menu_raise      = self._sound_menu_raise
+        self.sound_menu._sound_menu_play_toggle= self._sound_menu_play_toggle
+        self.sound_menu._sound_menu_stats      = self._sound_menu_stats
+        self.sound_menu._sound_menu_track      = self._sound_menu_track
+        self.sound_menu._sound_menu_goto       = self._sound_menu_goto
+        self.sound_menu._sound_menu_set_cache_budget = self.set_cache_budget
+        self.sound_menu._sound_menu_add_layer  = self._sound_menu_add_layer
+        self.sound_menu._sound_menu_remove_layer = self._sound_menu_remove_layer
+        self.sound_menu._sound_menu_set_layer_volume = self._sound_menu_set_layer_volume
+        self.sound_menu._sound_menu_layers     = self._sound_menu_layers
+        self.sound_menu._sound_menu_set_crossfade = self.set_crossfade
+        self.sound_menu._sound_menu_set_sleep_timer = self._sound_menu_set_sleep_timer
+        self.sound_menu._sound_menu_set_wake_up = self._sound_menu_set_wake_up
+        self.sound_menu._sound_menu_schedule_noise = self._sound_menu_schedule_noise
+        self.sound_menu._sound_menu_cancel_timer = self.cancel_timer
+        self.sound_menu._sound_menu_timers     = self.get_timers
+        self.sound_menu._sound_menu_set_power_profile = self.set_power_profile
+
+        self._restore_state()
+
+        # Autostart when click on sound indicator icon, as soon as the main loop runs
+        self._started = False
+        GLib.idle_add(self._autostart)
+        GLib.timeout_add_seconds(10, self._on_started) # Even if the audio never starts
+
+    def _restore_state(self):
+        """Volume, layers, crossfade, cache budget and sleep timer of the last run"""
+        state = self.noise.state
+        self.pcm_cache.max_bytes = state.get('cache_bytes', self.pcm_cache.max_bytes)
+        self.set_volume(state.get('volume', self.volume))
+        if state.get('crossfade', 0) > 0:
+            self.set_crossfade(state.get('crossfade'))
+        for filename, volume in state.get('layers', {}).items():
+            if filename in self.noise.noises:
+                self.add_layer(filename, volume)
+        sleep_at = state.get('sleep_at')
+        if sleep_at is not None and sleep_at > time.time():
+            self.set_timer(True, sleep_at - time.time())
+        else:
+            state.set(sleep_at=None)
+
+    def _init_desktop(self):
+        """Media keys and the window a few DE need"""
+        gi.require_version('Gtk', '3.0') # Only here, the daemon runs without the GTK typelib
         try:
+            gi.require_version('Keybinder', '3.0')
+            from gi.repository import Keybinder
             self.keybinder = Keybinder
             self.keybinder.init()
             if self.keybinder.bind('AudioPlay', self._sound_menu_play_toggle, None):
@@ -75,30 +185,170 @@ class ANoise:
 
         # Need in a few DE
         try:
+            from view import GUI
             self.window = GUI(self)
         except:
             pass
 
-        self.player = Gst.ElementFactory.make(PLAYBIN, "player")
-        self.player.connect("about-to-finish", self._loop)
+    def _loop(self, message):
+        """Start again the same sound in the EOS (only when it can't be looped by segments)"""
+        if self._segment_looping:
+            return
+        self.player.set_property('uri', self._get_uri())
 
-        dummy_i18n = (_("Coffee Shop"), _("Fire"), _("Forest"), _("Night"), _("Rain"), _("River"), _("Sea"), _("Storm"), _("Wind")) # Need i18n
+    def _get_uri(self, filename=None):
+        """Sound for the player (current one by default): its decoded copy if it's in the cache already"""
+        if filename is None:
+            filename = self.noise.get_current_filename()
+        if is_generated(filename) or archive.is_archived(filename):
+            return 'appsrc://'
+        uri = self.pcm_cache.get_uri(filename)
+        if uri is None:
+            uri = ''.join(['file://', filename])
+        return uri
 
-        # Overwrite libraty methods
-        self.sound_menu._sound_menu_is_playing = self._sound_menu_is_playing
-        self.sound_menu._sound_menu_play       = self._sound_menu_play
-        self.sound_menu._sound_menu_pause      = self._sound_menu_pause
-        self.sound_menu._sound_menu_next       = self._sound_menu_next
-        self.sound_menu._sound_menu_previous   = self._sound_menu_previous
-        self.sound_menu._sound_menu_raise      = self._sound_menu_raise
-        self.sound_menu._sound_menu_play_toggle= self._sound_menu_play_toggle
+    def _get_source_setup(self, filename):
+        """How to set up the source element of a noise: appsrc for generated and archived ones"""
+        if archive.is_archived(filename):
+            return lambda source: archive.ArchiveSource(source, filename)
+        if not is_generated(filename):
+            return lambda source: power.configure_source(source, self.power_profile)
+        frames = power.get_profile(self.power_profile)['frames']
+        return lambda source: GeneratedSource(source, get_color(filename), frames)
 
-        # Autostart when click on sound indicator icon
-        threading.Timer(1, self._sound_menu_play).start()
+    def _is_plain_file(self, filename):
+        """A sound file of its own, not generated nor inside an archive: the cache and loop points read those"""
+        return not is_generated(filename) and not archive.is_archived(filename)
 
-    def _loop(self, message):
-        """Start again the same sound in the EOS"""
-        self.player.set_property('uri', self.noise.get_current_filename_uri())
+    def _on_source_setup(self, player, source):
+        self._get_source_setup(self.noise.get_current_filename())(source)
+
+    def _load(self):
+        """Set the current sound and preroll it, playback starts once the loop segment is armed"""
+        self.player.set_property('uri', self._get_uri())
+        self.audio_filter.set_property('volume', self.noise.get_gain(self.noise.get_current_filename()))
+        self._segment = self.loop_points.get_segment(self.noise.get_current_filename())
+        self._segment_pending = self.segment_loop
+        self._segment_looping = False
+        self._loaded = True
+        if self._segment_pending:
+            self.stats.set_state(self.player, Gst.State.PAUSED)
+        else:
+            self.stats.set_state(self.player, Gst.State.PLAYING)
+
+    def _on_async_done(self, bus, message):
+        """Prerolled: a flushing segment seek makes the pipeline post segment-done instead of EOS"""
+        if not self._segment_pending:
+            return
+        self._segment_pending = False
+        self._segment_looping = self._segment_seek(Gst.SeekFlags.FLUSH | Gst.SeekFlags.SEGMENT)
+        if self.is_playing:
+            self.stats.set_state(self.player, Gst.State.PLAYING)
+
+    def _on_player_event(self, pad, info):
+        """End of the segment (streaming thread): queue the start again without flushing, so there is no gap
+
+        A non-flushing seek can't deadlock from here, and no busy main loop can delay it
+        """
+        if info.get_event().type == Gst.EventType.SEGMENT_DONE and self._segment_looping:
+            ended = Gst.util_get_timestamp()
+            self._segment_seek(Gst.SeekFlags.SEGMENT, pad)
+            self.stats.loop_done(ended)
+        return Gst.PadProbeReturn.OK
+
+    def _segment_seek(self, flags, pad=None):
+        """Seek to the loop segment: the analyzed loop points or the whole sound, upstream from a pad if given"""
+        start, stop = self._segment
+        event = Gst.Event.new_seek(1.0, Gst.Format.TIME, flags, Gst.SeekType.SET, start,
+            Gst.SeekType.SET if stop >= 0 else Gst.SeekType.NONE, stop)
+        if pad is not None:
+            return pad.send_event(event)
+        return self.player.send_event(event)
+
+    def _autostart(self):
+        self._sound_menu_play()
+        return False
+
+    def _on_started(self):
+        """First audio out: now the work that could wait"""
+        if self.noise.PATH_OBSERVER is not None:
+            return False
+        if os.getenv('ANOISE_TRACE_STARTUP'):
+            sys.stderr.write('anoise: first audio at %.6f\n' % time.monotonic())
+        self.noise.refresh_sound_file_observers()
+        self._on_noises_changed()
+        return False
+
+    def _watch_player_buffers(self):
+        if self._buffer_probe is None:
+            self._buffer_probe = self.audio_filter.get_static_pad('src').add_probe(
+                Gst.PadProbeType.BUFFER, self._on_player_buffer)
+
+    def _on_player_buffer(self, pad, info):
+        self._on_audio()
+        self._buffer_probe = None
+        return Gst.PadProbeReturn.REMOVE # No Python call for every buffer of a whole night
+
+    def _on_audio(self):
+        """A buffer of the playing noise is out (streaming thread)"""
+        if not self._started:
+            self._started = True
+            GLib.idle_add(self._on_started)
+        if self._skip_started is not None:
+            self._on_first_sample()
+
+    def _on_first_sample(self):
+        started, self._skip_started = self._skip_started, None
+        if started is not None:
+            self.skip_latencies.append(time.monotonic() - started)
+            self.stats.add('skip', self.skip_latencies[-1])
+
+    def get_skip_latency(self):
+        """Latency of the last skips, in seconds"""
+        latencies = list(self.skip_latencies)
+        return {
+            'last': latencies[-1] if latencies else None,
+            'max': max(latencies) if latencies else None,
+            'mean': sum(latencies) / len(latencies) if latencies else None,
+            'target': self.SKIP_LATENCY_TARGET,
+            'over_target': len([latency for latency in latencies if latency > self.SKIP_LATENCY_TARGET]),
+        }
+
+    def _sound_menu_stats(self):
+        """Health statistics for the D-Bus stats interface"""
+        stats = self.stats.get()
+        skip_latency = self.get_skip_latency()
+        stats['skip_target_ms'] = skip_latency['target'] * 1000
+        stats['skip_over_target'] = skip_latency['over_target']
+        return stats
+
+    def _sound_menu_track(self, index):
+        """Info of a noise for the sound menu, from the listing in memory (its pack is the album)"""
+        return ('', self.noise.get_pack(index) or '', self.noise.noises[index][0],
+                urllib.parse.quote(self.noise.get_icon_uri(index), ':/'),
+                urllib.parse.quote(self.noise.get_filename_uri(index), ':/'))
+
+    def _on_noises_changed(self):
+        self.sound_menu.tracks_changed(len(self.noise.noises), self.noise.get_current_index())
+        self._prefetch()
+        self.loop_points.analyze([self.noise.noises[i][1] for i in range(len(self.noise.noises))
+                                  if self._is_plain_file(self.noise.noises[i][1])])
+        return False
+
+    def _on_gain(self, filename):
+        """A noise got its loudness analyzed, level it if it's playing already"""
+        gain = self.noise.get_gain(filename)
+        if self.mixer is None and self._loaded and filename == self.noise.get_current_filename():
+            self.audio_filter.set_property('volume', gain)
+        if self._main_layer is not None and self._main_layer[0] == filename:
+            self._main_layer[1].set_gain(gain)
+        if filename in self._layers:
+            self._layers[filename].set_gain(gain)
+
+    def _prefetch(self):
+        """Warm up what next/previous would play"""
+        filenames = [filename for filename in self.noise.get_neighbour_filenames() if self._is_plain_file(filename)]
+        self.prefetcher.warm(filenames, self.noise.generation)
 
     def _sound_menu_is_playing(self):
         """Called in the first click"""
@@ -114,41 +364,58 @@ class ANoise:
     def _sound_menu_play(self, keypress = None, data = None):
         """Play"""
         self.is_playing = True # Need to overwrite this for an issue with autstart
-        self.sound_menu.song_changed(self.noise.get_current_index(), '', '', self.noise.get_name(),
-            urllib.parse.quote(self.noise.get_icon_uri(), ':/'),
-            urllib.parse.quote(self.noise.get_current_filename_uri(), ':/'))
-        self.player.set_property('uri', self.noise.get_current_filename_uri())
-        self.player.set_state(Gst.State.PLAYING)
+        self.sound_menu.song_changed(self.noise.get_current_index(),
+            *self._sound_menu_track(self.noise.get_current_index()))
+        if self.mixer is not None:
+            self._mixer_play()
+        elif self._loaded:
+            self.stats.set_state(self.player, Gst.State.PLAYING)
+        else:
+            self._load()
         self.sound_menu.signal_playing()
+        self._prefetch()
 
     def _sound_menu_stop(self, keypress = None, data = None):
         """Stop, different from pause in that it sets the pointer of the track to the start again"""
         self.is_playing = False
-        self.player.set_state(Gst.State.READY) # assuming this is akin to stop?
+        if self.mixer is not None:
+            self.stats.set_state(self.mixer.pipeline, Gst.State.READY)
+        self.stats.set_state(self.player, Gst.State.READY) # assuming this is akin to stop?
+        self._loaded = False
         self.sound_menu.signal_stopped()
 
     def _sound_menu_pause(self, keypress = None, data = None):
         """Pause"""
         self.is_playing = False # Need to overwrite this for an issue with autstart
-        self.player.set_state(Gst.State.PAUSED)
+        if self.mixer is not None:
+            self.stats.set_state(self.mixer.pipeline, Gst.State.PAUSED)
+        else:
+            self.stats.set_state(self.player, Gst.State.PAUSED)
         self.sound_menu.signal_paused()
 
-    def _set_new_play(self, what):
-        """Next or Previous"""
+    def _set_new_play(self, what, index=None):
+        """Next, Previous or Go to a noise of the tracklist"""
+        started = time.monotonic()
         # Get Next/Previous
         if what == 'next':
             self.noise.set_next()
         if what == 'previous':
             self.noise.set_previous()
-        # From pause?
-        self.player.set_state(Gst.State.READY)
+        if what == 'goto':
+            self.noise.set_current(index)
+        # From pause? (the mixer swaps the noise in place on play)
+        if self.mixer is None:
+            self.stats.set_state(self.player, Gst.State.READY)
+            self._loaded = False
         # Play
         if self.is_playing:
+            # Armed once the old noise is flushed, a late buffer of it would end the measure at once
+            self._skip_started = started
+            self._watch_player_buffers()
             self._sound_menu_play()
         else:
-            self.sound_menu.song_changed(self.noise.get_current_index(), '', '', self.noise.get_name(),
-                urllib.parse.quote(self.noise.get_icon_uri(), ':/'),
-                urllib.parse.quote(self.noise.get_current_filename_uri(), ':/'))
+            self.sound_menu.song_changed(self.noise.get_current_index(),
+                *self._sound_menu_track(self.noise.get_current_index()))
 
     def _sound_menu_previous(self, keypress = None, data = None):
         """Previous"""
@@ -158,25 +425,235 @@ class ANoise:
         """Next"""
         self._set_new_play('next')
 
+    def _sound_menu_goto(self, index):
+        """Go to a noise picked in the tracklist"""
+        self._set_new_play('goto', index)
+
+    def _mixer_play(self):
+        """Play the mixer, with the current noise as its main layer"""
+        filename = self.noise.get_current_filename()
+        if self._main_layer is None or self._main_layer[0] != filename:
+            old_layer = self._main_layer
+            layer = self.mixer.add_layer(self._get_uri(filename),
+                source_setup=self._get_source_setup(filename),
+                segment=self.loop_points.get_segment(filename),
+                gain=self.noise.get_gain(filename))
+            layer.first_buffer = self._on_audio
+            if old_layer is not None and self.crossfade > 0:
+                # Both play in the same pipeline while one fades into the other
+                self.mixer.crossfade(old_layer[1], layer, self.crossfade)
+            elif old_layer is not None:
+                self.mixer.remove_layer(old_layer[1])
+            self._main_layer = (filename, layer)
+        self.stats.set_state(self.mixer.pipeline, Gst.State.PLAYING)
+
+    def _use_mixer(self):
+        """From now on every noise goes through the mixer, so there is one output stream"""
+        if self.mixer is not None:
+            return
+        self.mixer = Mixer(make_audio_sink(self.stream, profile=self.power_profile), profile=self.power_profile)
+        self.mixer.set_volume(self.player.get_property('volume'))
+        self.stats.watch(self.mixer.pipeline)
+        self.stats.set_state(self.player, Gst.State.READY)
+        self._loaded = False
+        if self.is_playing:
+            self._mixer_play()
+
+    def set_crossfade(self, seconds):
+        """Crossfade next/previous over some seconds, 0 to switch at once"""
+        self.crossfade = seconds
+        self.noise.state.set(crossfade=seconds)
+        if seconds > 0:
+            self._use_mixer()
+
+    def add_layer(self, filename, volume=1.0):
+        """Mix another noise over the current one"""
+        if filename in self._layers:
+            self.set_layer_volume(filename, volume)
+            return
+        self._use_mixer()
+        self._layers[filename] = self.mixer.add_layer(self._get_uri(filename), volume,
+            self._get_source_setup(filename), self.loop_points.get_segment(filename),
+            self.noise.get_gain(filename))
+        self.noise.layers[filename] = volume
+        self.noise.state.set(layers=dict(self.noise.layers))
+        if self.is_playing:
+            self._mixer_play()
+
+    def remove_layer(self, filename):
+        """Stop mixing a noise, the others keep playing"""
+        layer = self._layers.pop(filename, None)
+        if layer is not None:
+            self.mixer.remove_layer(layer)
+        self.noise.layers.pop(filename, None)
+        self.noise.state.set(layers=dict(self.noise.layers))
+
+    def set_layer_volume(self, filename, volume):
+        """Volume of a mixed noise, from 0.0 to 1.0"""
+        if filename in self._layers:
+            self._layers[filename].set_volume(volume)
+            self.noise.layers[filename] = volume
+            self.noise.state.set(layers=dict(self.noise.layers))
+
+    def _sound_menu_add_layer(self, index, volume):
+        self.add_layer(self.noise.noises[index][1], volume)
+
+    def _sound_menu_remove_layer(self, index):
+        self.remove_layer(self.noise.noises[index][1])
+
+    def _sound_menu_set_layer_volume(self, index, volume):
+        self.set_layer_volume(self.noise.noises[index][1], volume)
+
+    def _sound_menu_layers(self):
+        """Mixed noises for the sound menu, tracklist index > volume"""
+        layers = {}
+        for filename, volume in self.noise.layers.items():
+            index = self.noise.noises.index(filename)
+            if index >= 0:
+                layers[index] = volume
+        return layers
+
     def _sound_menu_raise(self):
         """Click on player"""
+        if self.headless:
+            return
+        if self.win_preferences is None:
+            from preferences import Preferences
+            self.win_preferences = Preferences(self)
         self.win_preferences.show()
 
+    def set_volume(self, volume):
+        """Volume of the whole output, from 0.0 to 1.0"""
+        self.volume = volume
+        self._set_output_volume(volume)
+        self.noise.state.set(volume=volume)
+
+    def _set_output_volume(self, volume):
+        # Fades go through here, so they don't change the volume the user chose
+        self.player.set_property('volume', volume)
+        if self.mixer is not None:
+            self.mixer.set_volume(volume)
+
     def set_timer(self, enable, seconds):
+        """Sleep timer: fade out and pause after some seconds"""
+        self.scheduler.cancel('sleep_fade')
         if enable:
-            self.timer = threading.Timer(seconds, self._set_future_pause)
-            self.timer.start()
+            fade = min(self.FADE_OUT, seconds)
+            self.scheduler.schedule('sleep', seconds - fade, self._start_sleep_fade, fade)
+            self.noise.state.set(sleep_at=time.time() + seconds) # Wall clock, it outlives this run
         else:
-            self.timer.cancel()
+            self.scheduler.cancel('sleep')
+            self._set_output_volume(self.volume)
+            self.noise.state.set(sleep_at=None)
+
+    def _start_sleep_fade(self, fade):
+        self.scheduler.ramp('sleep_fade', self._set_output_volume, self.volume, 0.0, fade,
+            self._set_future_pause)
 
     def _set_future_pause(self):
-        self.win_preferences.set_show_timer()
+        self.noise.state.set(sleep_at=None)
+        if self.win_preferences is not None:
+            self.win_preferences.set_show_timer()
         self._sound_menu_pause()
+        self._set_output_volume(self.volume) # Ready for the next play
+
+    def set_wake_up(self, enable, seconds):
+        """Start playing after some seconds, fading in"""
+        if enable:
+            self.scheduler.schedule('wake_up', seconds, self._wake_up)
+        else:
+            self.scheduler.cancel('wake_up')
+
+    def _wake_up(self):
+        self.scheduler.cancel('sleep_fade')
+        self._set_output_volume(0.0)
+        self._sound_menu_play()
+        self.scheduler.ramp('wake_up_fade', self._set_output_volume, 0.0, self.volume, self.FADE_IN)
+
+    def schedule_noise(self, seconds, filename):
+        """Change to a noise after some seconds, None cancels it"""
+        if filename is None:
+            self.scheduler.cancel('change')
+        else:
+            self.scheduler.schedule('change', seconds, self._change_noise, filename)
+
+    def _change_noise(self, filename):
+        index = self.noise.noises.index(filename)
+        if index >= 0:
+            self._set_new_play('goto', index)
+
+    def set_power_profile(self, name):
+        """Power profile for the next start: 'normal' or 'low-power' (bigger buffers, fewer wakeups), False if unknown"""
+        if name not in power.PROFILES:
+            return False
+        self.noise.state.set(power_profile=name)
+        return True
+
+    def set_cache_budget(self, max_bytes):
+        """Disk space for the decoded copies of the noises"""
+        self.pcm_cache.max_bytes = max_bytes
+        self.noise.state.set(cache_bytes=max_bytes)
+
+    def get_sleep_at(self):
+        """Wall clock time the sleep timer stops playing at, None without one"""
+        return self.noise.state.get('sleep_at')
+
+    def quit_on_signals(self, quit):
+        """Logout and systemd end ANoise with SIGTERM or SIGHUP, which skip atexit: save the state, then quit()"""
+        for signum in (signal.SIGTERM, signal.SIGHUP, signal.SIGINT):
+            GLib.unix_signal_add(GLib.PRIORITY_HIGH, signum, self._on_quit_signal, quit)
+
+    def _on_quit_signal(self, quit):
+        self.noise.state.flush()
+        quit()
+        return False
+
+    def get_timers(self):
+        """Pending timers and fades, name > seconds until they end"""
+        return self.scheduler.get_jobs()
+
+    def cancel_timer(self, name):
+        """Cancel a timer listed by get_timers, True if it was pending"""
+        pending = name in self.scheduler.get_jobs()
+        if name in ('sleep', 'sleep_fade'):
+            self._sound_menu_set_sleep_timer(0)
+        elif name in ('wake_up', 'wake_up_fade'):
+            self.set_wake_up(False, 0)
+            if self.scheduler.cancel('wake_up_fade'):
+                self._set_output_volume(self.volume)
+        elif name == 'change':
+            self.schedule_noise(0, None)
+        return pending
+
+    def _sound_menu_set_sleep_timer(self, seconds):
+        self.set_timer(seconds > 0, seconds)
+        if self.win_preferences is not None:
+            self.win_preferences.set_show_timer()
+
+    def _sound_menu_set_wake_up(self, seconds):
+        self.set_wake_up(seconds > 0, seconds)
+
+    def _sound_menu_schedule_noise(self, index, seconds):
+        self.schedule_noise(seconds, self.noise.noises[index][1])
 
 if __name__ == "__main__":
     Lock()
     # libcanberra named properties
     os.environ[ 'PULSE_PROP_application.icon_name' ] = "anoise"
     os.environ[ 'PULSE_PROP_media.role' ] = "music"
-    anoise = ANoise()
-    Gtk.main()
+    parser = argparse.ArgumentParser(description=_('Ambient Noise'))
+    parser.add_argument('--daemon', action='store_true', help='no desktop: only the player and its MPRIS controls')
+    parser.add_argument('--serve', type=int, metavar='PORT', help='stream the noises over HTTP on this port')
+    parser.add_argument('--power-profile', choices=sorted(power.PROFILES), help='default: the last one set')
+    args = parser.parse_args()
+    if args.daemon:
+        # Kiosks and servers: the GLib main loop, GStreamer and MPRIS, nothing else
+        anoise = ANoise(headless=True, stream_port=args.serve, power_profile=args.power_profile)
+        loop = GLib.MainLoop()
+        anoise.quit_on_signals(loop.quit)
+        loop.run()
+    else:
+        from gi.repository import Gtk
+        anoise = ANoise(stream_port=args.serve, power_profile=args.power_profile)
+        anoise.quit_on_signals(Gtk.main_quit)
+        Gtk.main()
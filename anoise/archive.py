@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+# ANoise 0.0.29 (Ambient Noise)
+# Copyright (C) 2015 Marcos Alvarez Costales https://launchpad.net/~costales
+#
+# ANoise is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# ANoise is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ANoise; if not, see http://www.gnu.org/licenses
+# for more information.
+
+"""Noise packs as zip or tar archives, played from inside the archive without extracting them.
+
+A sound in an archive is named <archive>!/<member>, e.g. ~/ANoise/rain.zip!/Rain/heavy.ogg
+"""
+
+import os, hashlib, tarfile, zipfile, threading, gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+SEPARATOR = '!/'
+ARCHIVE_TYPES = ['*.zip', '*.tar', '*.tar.gz', '*.tgz', '*.tar.bz2', '*.tar.xz']
+Error = (IOError, OSError, zipfile.BadZipfile, tarfile.TarError)
+
+
+def is_archive(filename):
+    """Supported archive by its extension"""
+    filename = filename.lower()
+    return any(filename.endswith(pattern[1:]) for pattern in ARCHIVE_TYPES)
+
+
+def is_archived(filename):
+    """A sound inside an archive? A plain file name can have the separator too: rain!/heavy.ogg"""
+    return SEPARATOR in filename and is_archive(filename.split(SEPARATOR, 1)[0])
+
+
+def join(archive, member):
+    return SEPARATOR.join([archive, member])
+
+
+def split(filename):
+    """(archive, member) of a sound inside an archive"""
+    return tuple(filename.split(SEPARATOR, 1))
+
+
+def get_pack(filename):
+    """Archive of a sound as a pack name: rain.tar.gz > rain"""
+    name = os.path.basename(split(filename)[0])
+    for pattern in ARCHIVE_TYPES:
+        if name.lower().endswith(pattern[1:]):
+            return name[:-len(pattern[1:])]
+    return name
+
+
+def list_members(archive):
+    """Names of the files in an archive, from its index (the central directory of a zip)"""
+    if zipfile.is_zipfile(archive):
+        with zipfile.ZipFile(archive) as pack:
+            return [info.filename for info in pack.infolist() if not info.filename.endswith('/')]
+    with tarfile.open(archive) as pack:
+        return [info.name for info in pack.getmembers() if info.isfile()]
+
+
+class MemberFile:
+    """A member open for reading: closing it closes its archive too"""
+    def __init__(self, member_file, pack):
+        self._file = member_file
+        self._pack = pack
+
+    def read(self, size=-1):
+        return self._file.read(size)
+
+    def seek(self, offset, whence=0):
+        return self._file.seek(offset, whence)
+
+    def close(self):
+        try:
+            self._file.close()
+        finally:
+            self._pack.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def open_member(archive, member):
+    """(file object, size) to read a member, seekable; close the file object when done"""
+    if zipfile.is_zipfile(archive):
+        pack = zipfile.ZipFile(archive)
+    else:
+        pack = tarfile.open(archive)
+    try:
+        if isinstance(pack, zipfile.ZipFile):
+            return MemberFile(pack.open(member), pack), pack.getinfo(member).file_size
+        info = pack.getmember(member)
+        return MemberFile(pack.extractfile(info), pack), info.size
+    except Exception:
+        pack.close() # Not in the archive (any more), or unreadable
+        raise
+
+
+def extract_icon(archive, member, cache_dir):
+    """Icons have to be files for the sound menu: copy one out of its archive once, None if it can't"""
+    st = os.stat(archive)
+    key = '\0'.join([archive, member, str(st.st_mtime_ns), str(st.st_size)])
+    icon = os.path.join(cache_dir, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.png')
+    if os.path.exists(icon):
+        return icon
+    try:
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        member_file, size = open_member(archive, member)
+        with member_file:
+            data = member_file.read()
+        with open(icon + '.part', 'wb') as icon_file:
+            icon_file.write(data)
+        os.rename(icon + '.part', icon)
+    except Error:
+        return None
+    return icon
+
+
+class ArchiveSource:
+    """Feed an appsrc with a sound inside an archive, read and seeked as GStreamer asks"""
+    def __init__(self, appsrc, filename, block=64 * 1024):
+        self.block = block
+        self._file, size = open_member(*split(filename))
+        self._lock = threading.Lock() # need-data and seek-data come from streaming threads
+        appsrc.set_property('stream-type', 2) # Random access, the demuxers seek it like a file
+        appsrc.set_property('format', Gst.Format.BYTES)
+        appsrc.set_property('size', size)
+        appsrc.connect('need-data', self._on_need_data)
+        appsrc.connect('seek-data', self._on_seek_data)
+
+    def _on_need_data(self, appsrc, length):
+        with self._lock:
+            data = self._file.read(length if length > 0 else self.block)
+        if data:
+            appsrc.emit('push-buffer', Gst.Buffer.new_wrapped(data))
+        else:
+            appsrc.emit('end-of-stream')
+
+    def _on_seek_data(self, appsrc, offset):
+        with self._lock:
+            self._file.seek(offset)
+        return True
+
+    def close(self):
+        """Close the member and its archive, when the appsrc is done with them"""
+        with self._lock:
+            self._file.close()
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+# ANoise 0.0.29 (Ambient Noise)
+# Copyright (C) 2015 Marcos Alvarez Costales https://launchpad.net/~costales
+#
+# ANoise is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# ANoise is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ANoise; if not, see http://www.gnu.org/licenses
+# for more information.
+
+import os, threading, collections, gi
+from concurrent.futures import ThreadPoolExecutor
+from six.moves import queue
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+from xdg import BaseDirectory
+
+
+class PCMCache:
+    """Decoded copies of the noises, so a sound is decoded only once and not in every play"""
+    def __init__(self, get_hash, max_bytes=512 * 1024 * 1024):
+        self._get_hash = get_hash # Filename > content hash, None until it's hashed
+        self.CACHE_DIR = os.path.join(BaseDirectory.xdg_cache_home, 'anoise', 'pcm')
+        # Already in the usual output format, so the sink neither decodes nor resamples
+        self.CAPS = 'audio/x-raw,format=S16LE,layout=interleaved,rate=48000,channels=2'
+        self.max_bytes = max_bytes
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._worker = None
+
+        if not os.path.exists(self.CACHE_DIR):
+            try:
+                os.makedirs(self.CACHE_DIR)
+            except OSError:
+                pass
+
+    def get_cached_filename(self, filename):
+        """Cache filename for a sound, keyed by its content so duplicates share a copy, None until it's hashed"""
+        key = self._get_hash(filename)
+        if key is None:
+            return None
+        return os.path.join(self.CACHE_DIR, key + '.wav')
+
+    def get_uri(self, filename):
+        """Decoded sound as a file:// uri, None while it isn't decoded yet"""
+        cached = self.get_cached_filename(filename)
+        if cached is None:
+            return None
+
+        if os.path.exists(cached):
+            try:
+                os.utime(cached, None) # Last use, for the LRU
+            except OSError:
+                pass
+            return ''.join(['file://', cached])
+
+        self.decode(filename, cached)
+        return None
+
+    def decode(self, filename, cached):
+        """Queue a sound to be decoded in background into its cache filename"""
+        with self._lock:
+            if cached in self._pending:
+                return # Being decoded already, maybe from a duplicate
+            self._pending.add(cached)
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run)
+                self._worker.daemon = True
+                self._worker.start()
+        self._queue.put((filename, cached))
+
+    def decode_now(self, filename):
+        """Decode a sound in the calling thread, its decoded filename or None (not hashed yet, or decoding elsewhere)"""
+        cached = self.get_cached_filename(filename)
+        if cached is None:
+            return None
+        if not os.path.exists(cached):
+            with self._lock:
+                if cached in self._pending:
+                    return None # The background worker has it
+                self._pending.add(cached)
+            try:
+                self._decode(filename, cached)
+            except Exception:
+                pass
+            with self._lock:
+                self._pending.discard(cached)
+            self.evict()
+        try:
+            os.utime(cached, None) # Wanted soon, last to be evicted
+        except OSError:
+            return None
+        return cached
+
+    def _run(self):
+        # Only one decode at a time, this is a background job
+        while True:
+            filename, cached = self._queue.get()
+            try:
+                self._decode(filename, cached)
+            except Exception:
+                pass
+            with self._lock:
+                self._pending.discard(cached)
+            self.evict()
+
+    def _decode(self, filename, cached):
+        if os.path.exists(cached):
+            return
+        partial = cached + '.part'
+
+        pipeline = Gst.parse_launch(' ! '.join([
+            'uridecodebin name=src', 'audioconvert', 'audioresample',
+            self.CAPS, 'wavenc', 'filesink name=sink']))
+        pipeline.get_by_name('src').set_property('uri', ''.join(['file://', filename]))
+        pipeline.get_by_name('sink').set_property('location', partial)
+        pipeline.set_state(Gst.State.PLAYING)
+        message = pipeline.get_bus().timed_pop_filtered(Gst.CLOCK_TIME_NONE,
+            Gst.MessageType.EOS | Gst.MessageType.ERROR)
+        pipeline.set_state(Gst.State.NULL)
+
+        if message is not None and message.type == Gst.MessageType.EOS:
+            os.rename(partial, cached) # Atomic, the player never sees a half file
+        else:
+            try:
+                os.remove(partial)
+            except OSError:
+                pass
+
+    def evict(self):
+        """Remove the least recently used sounds while the cache is over its budget"""
+        entries = []
+        total = 0
+        try:
+            for name in os.listdir(self.CACHE_DIR):
+                if not name.endswith('.wav'):
+                    continue
+                path = os.path.join(self.CACHE_DIR, name)
+                st = os.stat(path)
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        except OSError:
+            return
+
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+
+class Prefetcher:
+    """Keep the noises around the current one decoded and their heads warm, so a skip neither decodes nor waits for the disk"""
+    def __init__(self, pcm_cache, head_bytes=1024 * 1024, size=4):
+        self.pcm_cache = pcm_cache
+        self.HEAD_BYTES = head_bytes
+        self.SIZE = size
+        self._warm = collections.OrderedDict() # Filenames, least recently wanted first
+        self._generation = None
+        self._pool = ThreadPoolExecutor(max_workers=1)
+
+    def warm(self, filenames, generation):
+        """Prefetch these sounds, forgetting everything if the listing changed since the last call"""
+        if generation != self._generation:
+            self._warm.clear()
+            self._generation = generation
+        for filename in filenames:
+            if filename in self._warm:
+                self._warm.move_to_end(filename)
+                continue
+            self._warm[filename] = True
+            self._pool.submit(self._read_head, filename)
+        while len(self._warm) > self.SIZE:
+            self._warm.popitem(last=False)
+
+    def _read_head(self, filename):
+        # Decoded now, ahead of the background decodes, then its head read into the page cache
+        # Only a sound not hashed yet is left undecoded: then it's just its file head, I/O only
+        cached = self.pcm_cache.decode_now(filename)
+        if cached is not None:
+            filename = cached
+        try:
+            with open(filename, 'rb') as head:
+                if hasattr(os, 'posix_fadvise'):
+                    os.posix_fadvise(head.fileno(), 0, self.HEAD_BYTES, os.POSIX_FADV_WILLNEED)
+                head.read(self.HEAD_BYTES)
+        except (IOError, OSError):
+            pass
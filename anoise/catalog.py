@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+# ANoise 0.0.29 (Ambient Noise)
+# Copyright (C) 2015 Marcos Alvarez Costales https://launchpad.net/~costales
+#
+# ANoise is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# ANoise is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ANoise; if not, see http://www.gnu.org/licenses
+# for more information.
+
+import os, sqlite3
+from xdg import BaseDirectory
+import archive
+
+
+class Catalog:
+    """Sound files already seen, so a start only rescans the directories that changed"""
+    FIELDS = ('path', 'dir', 'title', 'icon', 'mtime', 'size', 'duration', 'codec', 'rate', 'valid', 'gain',
+              'hash', 'hash_mtime', 'hash_size')
+    SCHEMA = 5 # Bump when FIELDS change, the catalog is rebuilt then
+
+    def __init__(self, titler):
+        self.CACHE_DIR = os.path.join(BaseDirectory.xdg_cache_home, 'anoise')
+        self.DB_FILE = os.path.join(self.CACHE_DIR, 'catalog.sqlite')
+        self.ICON_DIR = os.path.join(self.CACHE_DIR, 'icons') # Icons copied out of archives
+        self._titler = titler # Filename > untranslated title
+        self.files = {}       # Path > row
+        self._dirs = {}       # Directory > (mtime, {path: row})
+        self._children = {}   # Directory > set of its subdirectories
+
+        if not os.path.exists(self.CACHE_DIR):
+            try:
+                os.makedirs(self.CACHE_DIR)
+            except OSError:
+                pass
+
+        try:
+            self.db = sqlite3.connect(self.DB_FILE)
+            self._create()
+        except sqlite3.Error:
+            self.db = sqlite3.connect(':memory:') # Broken catalog, it'll be a slow start
+            self._create()
+        self._load()
+
+    def _create(self):
+        if self.db.execute('PRAGMA user_version').fetchone()[0] != self.SCHEMA:
+            self.db.execute('DROP TABLE IF EXISTS dirs')
+            self.db.execute('DROP TABLE IF EXISTS files')
+            self.db.execute('PRAGMA user_version = %d' % self.SCHEMA)
+        self.db.execute('CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, mtime INTEGER)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, dir TEXT, '
+                        'title TEXT, icon TEXT, mtime INTEGER, size INTEGER, '
+                        'duration INTEGER, codec TEXT, rate INTEGER, valid INTEGER, gain REAL, '
+                        'hash TEXT, hash_mtime INTEGER, hash_size INTEGER)')
+        self.db.commit()
+
+    def _load(self):
+        for path, mtime in self.db.execute('SELECT path, mtime FROM dirs'):
+            self._dirs[path] = (mtime, {})
+        for path in self._dirs:
+            parent = os.path.dirname(path)
+            if parent in self._dirs and parent != path:
+                self._children.setdefault(parent, set()).add(path)
+        for values in self.db.execute('SELECT %s FROM files' % ', '.join(self.FIELDS)):
+            row = dict(zip(self.FIELDS, values))
+            if row['dir'] in self._dirs:
+                self._dirs[row['dir']][1][row['path']] = row
+                self.files[row['path']] = row
+
+    def get(self, filename):
+        """Catalog row of a sound file, None if it isn't cataloged"""
+        return self.files.get(filename)
+
+    def scan(self, directory, is_sound_file):
+        """Sound files in a directory tree, each directory only listed again when its mtime changed"""
+        files = []
+        with self.db:
+            self._scan(directory, is_sound_file, files)
+        return files
+
+    def _scan(self, directory, is_sound_file, files, st=None):
+        try:
+            mtime = (st or os.stat(directory)).st_mtime_ns
+        except OSError:
+            self._forget_dir(directory)
+            return
+
+        cached = self._dirs.get(directory)
+        if cached is not None and cached[0] == mtime:
+            # Same entries, but a subdirectory could have changed inside
+            files.extend(cached[1])
+            for subdir in sorted(self._children.get(directory, ())):
+                self._scan(subdir, is_sound_file, files)
+            return
+
+        old_rows = cached[1] if cached is not None else {}
+        rows = {}
+        subdirs = {}
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            entries = []
+        names = set(entry.name for entry in entries)
+        for entry in entries:
+            try:
+                # The dirent type saves a stat, the file ones are stat'ed once for their mtime and size
+                if entry.is_dir(follow_symlinks=False):
+                    if not entry.name.startswith('.'):
+                        subdirs[entry.path] = entry
+                elif is_sound_file(entry.path) and entry.is_file():
+                    row = self._make_row(entry.path, names, old_rows.get(entry.path), entry.stat())
+                    if row is not None:
+                        rows[entry.path] = row
+                elif archive.is_archive(entry.path) and entry.is_file():
+                    rows.update(self._make_archive_rows(entry.path, entry.stat(), is_sound_file, old_rows))
+            except OSError:
+                pass
+
+        for filename in old_rows:
+            if filename not in rows:
+                self.files.pop(filename, None)
+                self.db.execute('DELETE FROM files WHERE path = ?', (filename,))
+        for row in rows.values():
+            self._store(row)
+        self.db.execute('INSERT OR REPLACE INTO dirs (path, mtime) VALUES (?, ?)', (directory, mtime))
+        self._dirs[directory] = (mtime, rows)
+        for subdir in self._children.get(directory, set()) - set(subdirs):
+            self._forget_dir(subdir)
+        self._children[directory] = set(subdirs)
+
+        files.extend(rows)
+        for path in sorted(subdirs):
+            try:
+                st = subdirs[path].stat(follow_symlinks=False)
+            except OSError:
+                continue
+            self._scan(path, is_sound_file, files, st)
+
+    def add(self, filename):
+        """Catalog a single new sound file"""
+        directory = os.path.dirname(filename)
+        row = self._make_row(filename, None, self.files.get(filename))
+        if row is not None:
+            with self.db:
+                self._store(row)
+            if directory in self._dirs:
+                self._dirs[directory][1][filename] = row
+        return row
+
+    def invalidate(self, directory):
+        """List a directory again in the next scan, even if its mtime didn't change (a file rewritten in place)"""
+        cached = self._dirs.get(directory)
+        if cached is not None:
+            self._dirs[directory] = (None, cached[1])
+
+    def remove(self, filename):
+        """Forget a single sound file"""
+        row = self.files.pop(filename, None)
+        if row is None:
+            return
+        if row['dir'] in self._dirs:
+            self._dirs[row['dir']][1].pop(filename, None)
+        with self.db:
+            self.db.execute('DELETE FROM files WHERE path = ?', (filename,))
+
+    def update(self, filename, **values):
+        """Store more info about a cataloged sound file"""
+        row = self.files.get(filename)
+        if row is None:
+            return
+        row.update(values)
+        with self.db:
+            self._store(row)
+
+    def update_many(self, changes):
+        """Store more info about several sound files at once: (filename, {field: value}) pairs"""
+        with self.db:
+            for filename, values in changes:
+                row = self.files.get(filename)
+                if row is not None:
+                    row.update(values)
+                    self._store(row)
+
+    def _make_row(self, filename, names, old_row, st=None):
+        if st is None:
+            try:
+                st = os.stat(filename)
+            except OSError:
+                return None
+        if old_row is not None and old_row['mtime'] == st.st_mtime_ns and old_row['size'] == st.st_size:
+            row = old_row # Unchanged, keep what is known about it
+        else:
+            row = dict.fromkeys(self.FIELDS)
+            row.update(path=filename, dir=os.path.dirname(filename), mtime=st.st_mtime_ns, size=st.st_size,
+                       title=self._titler(filename))
+        icon = '.'.join([os.path.splitext(filename)[0], 'png'])
+        if names is None:
+            row['icon'] = icon if os.path.exists(icon) else None
+        else:
+            row['icon'] = icon if os.path.basename(icon) in names else None
+        self.files[filename] = row
+        return row
+
+    def _make_archive_rows(self, filename, st, is_sound_file, old_rows):
+        # Only the index of the archive is read, and only when the archive changed
+        rows = {}
+        try:
+            members = archive.list_members(filename)
+        except archive.Error:
+            return rows
+        names = set(members)
+        for member in members:
+            path = archive.join(filename, member)
+            if not is_sound_file(path):
+                continue
+            row = old_rows.get(path)
+            if row is None or row['mtime'] != st.st_mtime_ns or row['size'] != st.st_size:
+                # Probed later as the other sound files, read out of the archive
+                row = dict.fromkeys(self.FIELDS)
+                row.update(path=path, dir=os.path.dirname(filename), mtime=st.st_mtime_ns, size=st.st_size,
+                           title=self._titler(path))
+                icon = '.'.join([os.path.splitext(member)[0], 'png'])
+                if icon in names:
+                    row['icon'] = archive.extract_icon(filename, icon, self.ICON_DIR)
+            self.files[path] = row
+            rows[path] = row
+        return rows
+
+    def _store(self, row):
+        self.db.execute('INSERT OR REPLACE INTO files (%s) VALUES (%s)' % (
+            ', '.join(self.FIELDS), ', '.join('?' * len(self.FIELDS))),
+            [row[field] for field in self.FIELDS])
+
+    def _forget_dir(self, directory):
+        for subdir in self._children.pop(directory, ()):
+            self._forget_dir(subdir)
+        cached = self._dirs.pop(directory, None)
+        if cached is None:
+            return
+        with self.db:
+            for filename in cached[1]:
+                self.files.pop(filename, None)
+            self.db.execute('DELETE FROM files WHERE dir = ?', (directory,))
+            self.db.execute('DELETE FROM dirs WHERE path = ?', (directory,))
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+# ANoise 0.0.29 (Ambient Noise)
+# Copyright (C) 2015 Marcos Alvarez Costales https://launchpad.net/~costales
+#
+# ANoise is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# ANoise is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ANoise; if not, see http://www.gnu.org/licenses
+# for more information.
+
+import gi, importlib.util
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+numpy = None # Imported when the first noise is generated, it's slow to load
+
+GENERATED_PREFIX = 'generated://'
+COLORS = ('white', 'pink', 'brown')
+RATE = 48000
+CHANNELS = 2
+CAPS = 'audio/x-raw,format=F32LE,layout=interleaved,rate=%d,channels=%d' % (RATE, CHANNELS)
+
+
+def is_available():
+    """Generated noises need NumPy"""
+    return importlib.util.find_spec('numpy') is not None
+
+
+def _import_numpy():
+    global numpy
+    if numpy is None:
+        import numpy
+
+
+def is_generated(filename):
+    return filename.startswith(GENERATED_PREFIX)
+
+
+def get_color(filename):
+    return filename[len(GENERATED_PREFIX):]
+
+
+class ColoredNoise:
+    """White, pink or brown noise, synthesized in vectorized blocks"""
+    PINK_ROWS = 16
+    BROWN_LEAK = 0.9987 # About a 10 Hz corner at 48 kHz, so it doesn't drift
+    SUB_BLOCK = 8192    # Keeps BROWN_LEAK ** -n well inside float range
+    LEVEL = 0.1         # RMS, about -20 dBFS
+
+    def __init__(self, color):
+        _import_numpy()
+        self.color = color
+        self._random = numpy.random.default_rng()
+        self._frame = 0
+        self._rows = self._random.standard_normal((self.PINK_ROWS, CHANNELS))
+        self._brown = numpy.zeros(CHANNELS)
+
+    def generate(self, frames):
+        """Next block of frames as interleaved float32"""
+        if self.color == 'pink':
+            block = self._pink(frames)
+        elif self.color == 'brown':
+            block = self._brown_block(frames)
+        else:
+            block = self._random.standard_normal((frames, CHANNELS))
+        self._frame += frames
+        block *= self.LEVEL
+        numpy.clip(block, -1.0, 1.0, out=block)
+        return block.astype(numpy.float32)
+
+    def _pink(self, frames):
+        # Voss-McCartney: row k holds a random value for 2**k frames, the sum falls 3 dB/octave
+        positions = numpy.arange(self._frame, self._frame + frames)
+        block = self._random.standard_normal((frames, CHANNELS))
+        for k in range(self.PINK_ROWS):
+            changes = (positions & ((1 << k) - 1)) == 0
+            count = int(numpy.count_nonzero(changes))
+            values = numpy.empty((count + 1, CHANNELS))
+            values[0] = self._rows[k]
+            values[1:] = self._random.standard_normal((count, CHANNELS))
+            block += values[numpy.cumsum(changes)]
+            self._rows[k] = values[-1]
+        return block / numpy.sqrt(self.PINK_ROWS + 1)
+
+    def _brown_block(self, frames):
+        # Leaky integrator y[n] = a * y[n-1] + w[n], solved in closed form per sub-block
+        block = numpy.empty((frames, CHANNELS))
+        scale = numpy.sqrt(1.0 - self.BROWN_LEAK ** 2)
+        for start in range(0, frames, self.SUB_BLOCK):
+            size = min(self.SUB_BLOCK, frames - start)
+            white = self._random.standard_normal((size, CHANNELS)) * scale
+            powers = self.BROWN_LEAK ** numpy.arange(size)
+            part = numpy.cumsum(white / powers[:, None], axis=0)
+            part += self.BROWN_LEAK * self._brown
+            part *= powers[:, None]
+            block[start:start + size] = part
+            self._brown = part[-1]
+        return block
+
+
+class GeneratedSource:
+    """Feed an appsrc with a generated noise, no files and no decoding"""
+    def __init__(self, appsrc, color, block=4096):
+        self.generator = ColoredNoise(color)
+        self.block = block
+        self.frames = 0
+        appsrc.set_property('caps', Gst.Caps.from_string(CAPS))
+        appsrc.set_property('format', Gst.Format.TIME)
+        appsrc.set_property('max-bytes', block * CHANNELS * 4 * 2)
+        appsrc.connect('need-data', self._on_need_data)
+
+    def _on_need_data(self, appsrc, length):
+        buffer = Gst.Buffer.new_wrapped(self.generator.generate(self.block).tobytes())
+        buffer.pts = self.frames * Gst.SECOND // RATE
+        buffer.duration = self.block * Gst.SECOND // RATE
+        self.frames += self.block
+        appsrc.emit('push-buffer', buffer)
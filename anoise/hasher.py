@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+# ANoise 0.0.29 (Ambient Noise)
+# Copyright (C) 2015 Marcos Alvarez Costales https://launchpad.net/~costales
+#
+# ANoise is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# ANoise is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ANoise; if not, see http://www.gnu.org/licenses
+# for more information.
+
+"""Content identity of the sound files: the same noise in two sound paths is the same noise"""
+
+import os, hashlib
+from pool import FilePool
+import archive
+
+BLOCK = 1024 * 1024
+
+
+def hash_file(filename, block=BLOCK):
+    """SHA-1 of the content of a sound file (or of a sound inside an archive), read a block at a time"""
+    digest = hashlib.sha1()
+    if archive.is_archived(filename):
+        sound_file = archive.open_member(*archive.split(filename))[0]
+    else:
+        sound_file = open(filename, 'rb')
+    with sound_file:
+        data = sound_file.read(block)
+        while data:
+            digest.update(data)
+            data = sound_file.read(block)
+    return digest.hexdigest()
+
+
+class Hasher(FilePool):
+    """Hash new sound files with a few background threads"""
+    def __init__(self, callback, workers=2):
+        # Called from the main loop with a list of (filename, (hash, mtime, size)), hashlib releases the GIL on big blocks
+        FilePool.__init__(self, callback, workers, batch=True)
+
+    def hash(self, filenames):
+        """Queue sound files to be hashed"""
+        self.queue(filenames)
+
+    def _work(self, filename):
+        # (hash, mtime, size): the stat is taken first, a file written while it's read looks changed
+        try:
+            st = os.stat(archive.split(filename)[0])
+            return (hash_file(filename), st.st_mtime_ns, st.st_size)
+        except archive.Error:
+            return None # Gone or unreadable: it keeps its own entry
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ANoise 0.0.29 (Ambient Noise)
+# Copyright (C) 2015 Marcos Alvarez Costales https://launchpad.net/~costales
+#
+# ANoise is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# ANoise is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ANoise; if not, see http://www.gnu.org/licenses
+# for more information.
+
+"""Seamless loop points for the noises.
+
+Run it to analyze the whole library at once: python3 looppoints.py
+"""
+
+import os, sys, json, hashlib, multiprocessing, importlib.util, gi
+from concurrent.futures import ProcessPoolExecutor
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst, GLib
+from xdg import BaseDirectory
+numpy = None # Only imported where the analysis runs, it's slow to load
+
+RATE = 48000
+CACHE_DIR = os.path.join(BaseDirectory.xdg_cache_home, 'anoise', 'loops')
+
+
+def is_available():
+    """The analysis needs NumPy, stored loop points are used without it"""
+    return importlib.util.find_spec('numpy') is not None
+
+
+def _import_numpy():
+    global numpy
+    if numpy is None:
+        import numpy
+
+
+def find_loop(samples, rate, match=0.25, head=2.0, tail=10.0, hop=0.25, threshold=0.6):
+    """Best (start, end, score) frames to loop a mono signal, None without a good seam
+
+    The first frames after a candidate start are cross-correlated (normalized, by FFT)
+    against the tail, the end is where the tail looks most like that start.
+    """
+    _import_numpy()
+    length = int(match * rate)
+    frames = len(samples)
+    region_start = frames - min(int(tail * rate), frames // 3)
+    region = samples[region_start:].astype(numpy.float64)
+    if len(region) < 2 * length:
+        return None
+
+    energy = numpy.concatenate(([0.0], numpy.cumsum(region ** 2)))
+    window_norm = numpy.sqrt(numpy.maximum(energy[length:] - energy[:-length], 0.0))
+    size = 1 << int(len(region) + length - 1).bit_length()
+    region_fft = numpy.fft.rfft(region, size)
+
+    best = None
+    for start in range(0, max(1, min(int(head * rate), region_start - length)), max(1, int(hop * rate))):
+        template = samples[start:start + length].astype(numpy.float64)
+        norm = numpy.sqrt(numpy.dot(template, template))
+        if norm == 0:
+            continue
+        correlation = numpy.fft.irfft(region_fft * numpy.conj(numpy.fft.rfft(template, size)), size)
+        score = correlation[:len(window_norm)] / (norm * window_norm + 1e-12)
+        end = int(numpy.argmax(score))
+        if best is None or score[end] > best[2]:
+            best = (start, region_start + end, float(score[end]))
+
+    if best is None or best[2] < threshold:
+        return None
+    return best
+
+
+def decode(filename, rate=RATE):
+    """Whole sound as mono float32 frames"""
+    _import_numpy()
+    pipeline = Gst.parse_launch(' ! '.join([
+        'uridecodebin name=src', 'audioconvert', 'audioresample',
+        'audio/x-raw,format=F32LE,channels=1,rate=%d' % rate, 'appsink name=sink sync=false']))
+    pipeline.get_by_name('src').set_property('uri', Gst.filename_to_uri(filename))
+    sink = pipeline.get_by_name('sink')
+    bus = pipeline.get_bus()
+    chunks = []
+    pipeline.set_state(Gst.State.PLAYING)
+    while True:
+        sample = sink.emit('try-pull-sample', Gst.SECOND)
+        if sample is not None:
+            buffer = sample.get_buffer()
+            chunks.append(buffer.extract_dup(0, buffer.get_size()))
+        elif sink.is_eos() or bus.pop_filtered(Gst.MessageType.ERROR) is not None:
+            break
+    pipeline.set_state(Gst.State.NULL)
+    return numpy.frombuffer(b''.join(chunks), dtype=numpy.float32)
+
+
+def _get_result_filenames(filename):
+    # Next to the sound like the icons, or in the cache when that dir isn't writable
+    key = hashlib.sha1(filename.encode('utf-8')).hexdigest()
+    return ['.'.join([os.path.splitext(filename)[0], 'loop']), os.path.join(CACHE_DIR, key + '.loop')]
+
+
+def read_result(filename):
+    """Stored analysis of a sound, None if there is none or the sound changed since"""
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+    for result_filename in _get_result_filenames(filename):
+        try:
+            with open(result_filename, 'r') as result_file:
+                result = json.load(result_file)
+        except (IOError, OSError, ValueError):
+            continue
+        if result.get('mtime') == st.st_mtime_ns and result.get('size') == st.st_size:
+            return result
+    return None
+
+
+def _write_result(filename, result):
+    data = json.dumps(result)
+    for result_filename in _get_result_filenames(filename):
+        try:
+            if not os.path.exists(os.path.dirname(result_filename)):
+                os.makedirs(os.path.dirname(result_filename))
+            with open(result_filename, 'w') as result_file:
+                result_file.write(data)
+            return
+        except (IOError, OSError):
+            pass
+
+
+def analyze_file(filename):
+    """Analyze a sound unless it's analyzed already (runs in the pool workers)"""
+    result = read_result(filename)
+    if result is not None:
+        return result
+
+    st = os.stat(filename)
+    result = {'mtime': st.st_mtime_ns, 'size': st.st_size, 'rate': RATE, 'start': None, 'end': None}
+    try:
+        loop = find_loop(decode(filename), RATE)
+    except Exception:
+        loop = None
+    if loop is not None:
+        result.update(start=loop[0], end=loop[1], score=loop[2])
+    _write_result(filename, result)
+    return result
+
+
+def _make_pool(workers=None):
+    # spawn: forking a process running GLib threads isn't safe
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+        mp_context=multiprocessing.get_context('spawn'))
+
+
+def _init_worker():
+    try:
+        os.nice(10) # Background job
+    except OSError:
+        pass
+    Gst.init(None)
+    _import_numpy()
+
+
+def get_segment(result):
+    """Stored analysis as a (start, stop) segment in nanoseconds, stop -1 is the end"""
+    if result is None or result.get('start') is None:
+        return (0, -1)
+    return (result['start'] * Gst.SECOND // result['rate'], result['end'] * Gst.SECOND // result['rate'])
+
+
+class LoopPoints:
+    """Loop points of the noises, analyzed in background by a process pool"""
+    def __init__(self, workers=2):
+        self.WORKERS = workers
+        self._segments = {} # Filename > (start, stop) in nanoseconds
+        self._pending = set()
+        self._analyzed = set()
+        self._pool = None
+
+    def get_segment(self, filename):
+        """(start, stop) nanoseconds to loop a sound, (0, -1) to loop it whole"""
+        if filename not in self._segments:
+            self._segments[filename] = get_segment(read_result(filename))
+        return self._segments[filename]
+
+    def analyze(self, filenames):
+        """Queue sounds without loop points, the pool skips the ones already analyzed"""
+        if not is_available():
+            return
+        if self._pool is None:
+            self._pool = _make_pool(self.WORKERS)
+        for filename in filenames:
+            if filename in self._pending or filename in self._analyzed:
+                continue
+            self._pending.add(filename)
+            future = self._pool.submit(analyze_file, filename)
+            future.add_done_callback(lambda future, filename=filename: GLib.idle_add(self._done, filename, future))
+
+    def _done(self, filename, future):
+        self._pending.discard(filename)
+        self._analyzed.add(filename)
+        try:
+            self._segments[filename] = get_segment(future.result())
+        except Exception:
+            pass
+        return False
+
+
+def main():
+    """Analyze every noise in the sound paths"""
+    Gst.init(None)
+    if not is_available():
+        sys.exit('NumPy is needed to find loop points')
+    from utils import Noise
+    from generators import is_generated
+    import archive
+    noise = Noise(watch=False, background=False) # Only the listing, no probing nor hashing meanwhile
+    # Only sound files of their own, generated noises and sounds in archives can't be read as files
+    filenames = [noise.noises[i][1] for i in range(len(noise.noises))
+                 if not is_generated(noise.noises[i][1]) and not archive.is_archived(noise.noises[i][1])]
+
+    with _make_pool() as pool:
+        for filename, result in zip(filenames, pool.map(analyze_file, filenames)):
+            if result.get('start') is None:
+                print('%s: no seamless loop, played whole' % filename)
+            else:
+                print('%s: %d-%d (%.2f)' % (filename, result['start'], result['end'], result['score']))
+
+
+if __name__ == "__main__":
+    main()
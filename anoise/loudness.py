@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ANoise 0.0.29 (Ambient Noise)
+# Copyright (C) 2015 Marcos Alvarez Costales https://launchpad.net/~costales
+#
+# ANoise is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# ANoise is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ANoise; if not, see http://www.gnu.org/licenses
+# for more information.
+
+"""Loudness of the noises, so every noise plays at the same level.
+
+Run it to analyze the whole library at once: python3 loudness.py
+"""
+
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst, GLib
+from pool import FilePool
+import archive
+
+MAX_GAIN = 6.0 # dB, more would clip quiet noises with loud peaks
+
+
+def analyze_file(filename):
+    """ReplayGain track gain of a sound in dB, None if it can't be analyzed"""
+    pipeline = Gst.parse_launch(' ! '.join([
+        'uridecodebin name=src', 'audioconvert', 'audioresample', 'rganalysis', 'fakesink sync=false']))
+    source = pipeline.get_by_name('src')
+    sources = [] # ArchiveSource of a sound in an archive, closed at the end
+    if archive.is_archived(filename):
+        source.set_property('uri', 'appsrc://')
+        source.connect('source-setup', lambda element, appsrc: sources.append(archive.ArchiveSource(appsrc, filename)))
+    else:
+        source.set_property('uri', Gst.filename_to_uri(filename))
+    bus = pipeline.get_bus()
+    gain = None
+    pipeline.set_state(Gst.State.PLAYING)
+    while True:
+        message = bus.timed_pop_filtered(Gst.CLOCK_TIME_NONE,
+            Gst.MessageType.TAG | Gst.MessageType.EOS | Gst.MessageType.ERROR)
+        if message.type == Gst.MessageType.TAG:
+            found, value = message.parse_tag().get_double(Gst.TAG_TRACK_GAIN)
+            if found:
+                gain = value
+        else:
+            break
+    pipeline.set_state(Gst.State.NULL)
+    for archive_source in sources:
+        archive_source.close()
+    if message.type != Gst.MessageType.EOS:
+        return None
+    return gain
+
+
+def get_factor(gain):
+    """Gain in dB as a volume factor"""
+    if gain is None:
+        return 1.0
+    return 10 ** (min(gain, MAX_GAIN) / 20.0)
+
+
+class Loudness(FilePool):
+    """Analyze the loudness of new sound files with a few background threads"""
+    def __init__(self, callback, workers=2):
+        # Called from the main loop with (filename, gain), decoding runs in GStreamer threads
+        FilePool.__init__(self, callback, workers)
+
+    def analyze(self, filenames):
+        """Queue sound files to be analyzed"""
+        self.queue(filenames)
+
+    def _work(self, filename):
+        # Errors aren't stored as a gain: a missing rganalysis could be installed later
+        try:
+            return analyze_file(filename)
+        except (GLib.Error,) + archive.Error:
+            return None
+
+
+def main():
+    """Analyze every noise in the sound paths not analyzed yet"""
+    Gst.init(None)
+    from utils import Noise
+    noise = Noise(watch=False, background=False) # Only the loudness pool, no probing nor hashing meanwhile
+    rows = [noise.catalog.get(noise.noises[i][1]) for i in range(len(noise.noises))]
+    rows = [row for row in rows if row is not None] # Sound files, not generated noises
+    noise.loudness.analyze([row['path'] for row in rows if row['gain'] is None])
+    loop = GLib.MainLoop()
+
+    def check():
+        if noise.loudness.is_busy():
+            return True
+        loop.quit()
+        return False
+
+    GLib.timeout_add(500, check)
+    loop.run()
+    for row in rows:
+        row = noise.catalog.get(row['path']) # With the gains found meanwhile
+        if row is not None and row['gain'] is not None:
+            print('%s: %+.2f dB' % (row['path'], row['gain']))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+# ANoise 0.0.29 (Ambient Noise)
+# Copyright (C) 2015 Marcos Alvarez Costales https://launchpad.net/~costales
+#
+# ANoise is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# ANoise is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ANoise; if not, see http://www.gnu.org/licenses
+# for more information.
+
+import gi, math
+import power
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst, GLib
+
+
+class Layer:
+    """One looping noise inside the mixer"""
+    def __init__(self, mixer, uri, volume, source_setup=None, segment=(0, -1), gain=1.0):
+        self.mixer = mixer
+        self.uri = uri
+        self.gain = gain # Loudness normalization, applied under the volume
+        self.segment = segment # (start, stop) looped, in nanoseconds
+        self.bin = Gst.Bin.new(None)
+        self.source = Gst.ElementFactory.make('uridecodebin', None)
+        self.convert = Gst.ElementFactory.make('audioconvert', None)
+        self.resample = Gst.ElementFactory.make('audioresample', None)
+        self.volume = Gst.ElementFactory.make('volume', None)
+        for element in (self.source, self.convert, self.resample, self.volume):
+            self.bin.add(element)
+        self.convert.link(self.resample)
+        self.resample.link(self.volume)
+
+        self.pad = Gst.GhostPad.new('src', self.volume.get_static_pad('src'))
+        self.bin.add_pad(self.pad)
+        self.pad.add_probe(Gst.PadProbeType.EVENT_DOWNSTREAM, self._on_event)
+        self.first_buffer = None # Called (from the streaming thread) with the first buffer out
+        self.pad.add_probe(Gst.PadProbeType.BUFFER, self._on_first_buffer)
+
+        self.set_volume(volume)
+        self.source.set_property('uri', uri)
+        self.source.connect('pad-added', self._on_pad_added)
+        if source_setup is not None:
+            self.source.connect('source-setup', lambda element, source: source_setup(source))
+
+    def _on_pad_added(self, element, pad):
+        sink = self.convert.get_static_pad('sink')
+        if sink.is_linked() or not pad.query_caps(None).to_string().startswith('audio/'):
+            return
+        # Joining a running mixer: its time starts now, not at the pipeline start
+        self.pad.set_offset(self.mixer.get_running_time())
+        pad.link(sink)
+        GLib.idle_add(self._seek, True)
+
+    def _on_event(self, pad, info):
+        event = info.get_event()
+        if event.type == Gst.EventType.SEGMENT_DONE:
+            # Right here in the streaming thread: a non-flushing seek can't deadlock,
+            # and a main loop round-trip would leave a hole in this layer
+            self._seek(False)
+            return Gst.PadProbeReturn.DROP
+        if event.type == Gst.EventType.EOS:
+            # Not seekable by segments: restart it, the other layers go on
+            GLib.idle_add(self._seek, True)
+            return Gst.PadProbeReturn.DROP
+        return Gst.PadProbeReturn.OK
+
+    def _on_first_buffer(self, pad, info):
+        if self.first_buffer is not None:
+            self.first_buffer()
+        return Gst.PadProbeReturn.REMOVE
+
+    def _seek(self, flush):
+        """Loop by segments: only the first (flushing) seek restarts this layer's timeline"""
+        flags = Gst.SeekFlags.SEGMENT
+        if flush:
+            flags |= Gst.SeekFlags.FLUSH
+            self.pad.set_offset(self.mixer.get_running_time())
+        start, stop = self.segment
+        event = Gst.Event.new_seek(1.0, Gst.Format.TIME, flags, Gst.SeekType.SET, start,
+            Gst.SeekType.SET if stop >= 0 else Gst.SeekType.NONE, stop)
+        self.volume.get_static_pad('src').send_event(event)
+        return False
+
+    def set_volume(self, volume):
+        self.volume.set_property('volume', volume * self.gain)
+
+    def get_volume(self):
+        return self.volume.get_property('volume') / self.gain
+
+    def set_gain(self, gain):
+        volume = self.get_volume()
+        self.gain = gain
+        self.set_volume(volume)
+
+
+# audiotestsrc wave enum, not in the introspection data
+WAVE_SILENCE = 4
+
+
+class Mixer:
+    """Several noises at once in one pipeline, with one output stream
+
+    The mixer runs live over a silent bed: a layer without data yet (opening a file,
+    seeking back to its loop start) is late for one output buffer at most, it never
+    holds back the other layers as a non-live audiomixer waiting for every pad would.
+    """
+    def __init__(self, sink=None, latency=100, profile=power.DEFAULT):
+        self.pipeline = Gst.Pipeline.new('mixer')
+        self.mixer = Gst.ElementFactory.make('audiomixer', None)
+        self.mixer.set_property('latency', latency * Gst.MSECOND) # How long a late layer is waited for
+        silence = Gst.ElementFactory.make('audiotestsrc', None)
+        silence.set_property('wave', WAVE_SILENCE)
+        silence.set_property('is-live', True)
+        power.configure_mixer(self.mixer, silence, profile) # Fewer, bigger output buffers in low-power
+        self.volume = Gst.ElementFactory.make('volume', None) # Master, over every layer
+        convert = Gst.ElementFactory.make('audioconvert', None)
+        resample = Gst.ElementFactory.make('audioresample', None)
+        if sink is None:
+            sink = Gst.ElementFactory.make('autoaudiosink', None)
+        for element in (silence, self.mixer, self.volume, convert, resample, sink):
+            self.pipeline.add(element)
+        silence.get_static_pad('src').link(self.mixer.get_request_pad('sink_%u'))
+        self.mixer.link(self.volume)
+        self.volume.link(convert)
+        convert.link(resample)
+        resample.link(sink)
+        self.layers = []
+        self._fades = {} # Layer > timeout source of the fade running on it
+        self.FADE_STEP = 20 # ms between volume steps
+
+    def get_running_time(self):
+        """Current running time of the pipeline, 0 when it isn't running"""
+        clock = self.pipeline.get_clock()
+        if clock is None:
+            return 0
+        return max(0, clock.get_time() - self.pipeline.get_base_time())
+
+    def add_layer(self, uri, volume=1.0, source_setup=None, segment=(0, -1), gain=1.0):
+        """Add a noise, it starts playing with the others"""
+        layer = Layer(self, uri, volume, source_setup, segment, gain)
+        self.pipeline.add(layer.bin)
+        layer.pad.link(self.mixer.get_request_pad('sink_%u'))
+        layer.bin.sync_state_with_parent()
+        self.layers.append(layer)
+        return layer
+
+    def fade(self, layer, volume, seconds, remove=False):
+        """Ramp a layer to a volume with an equal power curve, removing it at the end if asked"""
+        self._stop_fade(layer)
+        steps = max(1, int(seconds * 1000 / self.FADE_STEP))
+        self._fades[layer] = GLib.timeout_add(self.FADE_STEP, self._fade_step,
+            layer, layer.get_volume(), volume, steps, remove, [0])
+
+    def crossfade(self, old_layer, new_layer, seconds, volume=1.0):
+        """Fade in a new layer while the old one fades out and goes away"""
+        new_layer.set_volume(0.0)
+        self.fade(new_layer, volume, seconds)
+        self.fade(old_layer, 0.0, seconds, remove=True)
+
+    def _fade_step(self, layer, start, volume, steps, remove, step):
+        step[0] += 1
+        position = min(1.0, float(step[0]) / steps)
+        if volume >= start:
+            curve = math.sin(position * math.pi / 2)
+        else:
+            curve = 1.0 - math.cos(position * math.pi / 2)
+        layer.set_volume(start + (volume - start) * curve)
+        if position < 1.0:
+            return True
+        self._fades.pop(layer, None)
+        if remove:
+            self.remove_layer(layer)
+        return False
+
+    def _stop_fade(self, layer):
+        source = self._fades.pop(layer, None)
+        if source is not None:
+            GLib.source_remove(source)
+
+    def remove_layer(self, layer):
+        """Remove a noise once its pad is idle, without stopping the others"""
+        if layer not in self.layers:
+            return
+        self._stop_fade(layer)
+        self.layers.remove(layer)
+        layer.pad.add_probe(Gst.PadProbeType.IDLE, self._on_layer_idle, layer)
+
+    def _on_layer_idle(self, pad, info, layer):
+        peer = pad.get_peer()
+        if peer is not None:
+            pad.unlink(peer)
+        GLib.idle_add(self._drop_layer, layer, peer)
+        return Gst.PadProbeReturn.REMOVE
+
+    def _drop_layer(self, layer, peer):
+        if peer is not None:
+            self.mixer.release_request_pad(peer)
+        layer.bin.set_state(Gst.State.NULL)
+        self.pipeline.remove(layer.bin)
+        return False
+
+    def set_state(self, state):
+        self.pipeline.set_state(state)
+
+    def set_volume(self, volume):
+        self.volume.set_property('volume', volume)
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+# ANoise 0.0.29 (Ambient Noise)
+# Copyright (C) 2015 Marcos Alvarez Costales https://launchpad.net/~costales
+#
+# ANoise is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# ANoise is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ANoise; if not, see http://www.gnu.org/licenses
+# for more information.
+
+"""Background work on the sound files: a few threads, each file queued once, results back in the main loop"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from gi.repository import GLib
+
+
+class FilePool:
+    """Run _work(filename) in a few background threads, its results go to the callback from the main loop
+
+    _work returns None when a file can't be done: nothing is reported then, and the file is
+    tried again the next time it's queued. With batch the callback gets the list of (filename,
+    result) done since its last call, else it's called with every filename and result.
+    """
+    def __init__(self, callback, workers=2, batch=False):
+        self._callback = callback
+        self._batch = batch
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        self._pending = set()
+        self._done_files = [] # Done, waiting for the main loop
+        self._source = None
+        self._lock = threading.Lock()
+
+    def queue(self, filenames):
+        """Queue sound files, the ones waiting already aren't queued again"""
+        with self._lock:
+            for filename in filenames:
+                if filename not in self._pending:
+                    self._pending.add(filename)
+                    self._pool.submit(self._run, filename)
+
+    def _work(self, filename):
+        """The job on a file (pool thread), its result or None"""
+        raise NotImplementedError
+
+    def _run(self, filename):
+        try:
+            result = self._work(filename)
+        except Exception:
+            result = None # Never left pending, or is_busy() would never end
+        with self._lock:
+            self._done_files.append((filename, result))
+            if self._source is None:
+                # One main loop call for every file done meanwhile
+                self._source = GLib.idle_add(self._done)
+
+    def _done(self):
+        with self._lock:
+            done_files, self._done_files = self._done_files, []
+            self._source = None
+            for filename, result in done_files:
+                self._pending.discard(filename)
+        done_files = [(filename, result) for filename, result in done_files if result is not None]
+        if self._batch:
+            if done_files:
+                self._callback(done_files)
+        else:
+            for filename, result in done_files:
+                self._callback(filename, result)
+        return False
+
+    def is_busy(self):
+        """Are there sound files waiting?"""
+        with self._lock:
+            return bool(self._pending)
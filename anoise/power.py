@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+# ANoise 0.0.29 (Ambient Noise)
+# Copyright (C) 2015 Marcos Alvarez Costales https://launchpad.net/~costales
+#
+# ANoise is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# ANoise is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ANoise; if not, see http://www.gnu.org/licenses
+# for more information.
+
+"""Power profiles: a noise loop isn't interactive, it can trade latency for fewer CPU wakeups"""
+
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+# buffer-time and latency-time of the audio sink in microseconds (None keeps the sink default),
+# the blocksize of file sources and the frames per buffer of generated noises
+PROFILES = {
+    'normal':    {'buffer-time': None,    'latency-time': None,   'blocksize': None,        'frames': 4096},
+    'low-power': {'buffer-time': 2000000, 'latency-time': 500000, 'blocksize': 1024 * 1024, 'frames': 48000},
+}
+DEFAULT = 'normal'
+
+
+def get_profile(name):
+    return PROFILES.get(name, PROFILES[DEFAULT])
+
+
+def configure_sink(sink, name):
+    """Sink buffering of a profile, for autoaudiosink it goes to the real sink once it's created"""
+    profile = get_profile(name)
+    if profile['buffer-time'] is None:
+        return
+    if sink.find_property('buffer-time') is not None:
+        sink.set_property('buffer-time', profile['buffer-time'])
+        sink.set_property('latency-time', profile['latency-time'])
+    elif isinstance(sink, Gst.Bin): # autoaudiosink
+        sink.connect('child-added', lambda bin, child, child_name: configure_sink(child, name))
+
+
+def configure_source(source, name):
+    """Fewer and bigger reads from the files"""
+    blocksize = get_profile(name)['blocksize']
+    if blocksize is not None and source.find_property('blocksize') is not None:
+        source.set_property('blocksize', blocksize)
+
+
+def configure_mixer(mixer, silence, name):
+    """Mixer output and silent bed in buffers as big as the generated ones, at 48 kHz"""
+    profile = get_profile(name)
+    if profile['buffer-time'] is None:
+        return # The audiomixer and audiotestsrc defaults, as the sink keeps its own
+    silence.set_property('samplesperbuffer', profile['frames'])
+    mixer.set_property('output-buffer-duration', profile['frames'] * Gst.SECOND // 48000)
@@ -18,10 +18,10 @@
 
 import gi, os, shutil, webbrowser, subprocess
 from xdg import BaseDirectory
-from datetime import datetime, timedelta
+from datetime import datetime
 gi.require_version('Gtk', '3.0')
 gi.require_version('WebKit', '3.0')
-from gi.repository import Gtk, WebKit
+from gi.repository import Gtk
 # i18n
 import gettext
 gettext.textdomain('anoise')
@@ -60,10 +60,12 @@ class Preferences:
             self.cb_autostart.set_active(False)
 
         builder.connect_signals(self)
-
         self.win_width = self.win_height = 0
         self._save_window_size()
 
+        self._syncing = False # Showing the player's timer, not a change by the user
+        self.set_show_timer() # It could be running already, restored or set over D-Bus
+
     def show(self):
         self.win_preferences.show()
 
@@ -91,17 +93,26 @@ class Preferences:
                 pass
 
     def set_show_timer(self):
-        if self.cb_sleep.get_active():
-            self.cb_sleep.set_active(False)
+        """Show the sleep timer the player has, however it was set or ended"""
+        sleep_at = self.player.get_sleep_at()
+        if self.cb_sleep.get_active() != (sleep_at is not None):
+            self._syncing = True
+            self.cb_sleep.set_active(sleep_at is not None)
+            self._syncing = False
+        else:
+            self._show_timer(sleep_at)
 
     def on_cb_timesleep_toggled(self, widget, data=None):
-        seconds = self.sp_timer.get_value_as_int() * 60
-        self.sp_timer.set_sensitive(not self.cb_sleep.get_active())
-        self.player.set_timer(self.cb_sleep.get_active(), seconds)
-        if self.cb_sleep.get_active():
+        if not self._syncing:
+            self.player.set_timer(self.cb_sleep.get_active(), self.sp_timer.get_value_as_int() * 60)
+        self._show_timer(self.player.get_sleep_at())
+
+    def _show_timer(self, sleep_at):
+        self.sp_timer.set_sensitive(sleep_at is None)
+        if sleep_at is not None:
             self.lbl_minutes.hide()
             self.sp_timer.hide()
-            x = datetime.now() + timedelta(seconds=seconds)
+            x = datetime.fromtimestamp(sleep_at)
             msg = ' '.join([_("ANoise will stop at"), x.strftime('%H:%M')])
             self.cb_sleep.set_label(msg)
             self._restore_window_size()
@@ -132,6 +143,7 @@ class Preferences:
 
     def on_btn_show_noises_clicked(self, widget, data=None):
         self.btn_noises.hide()
+        from gi.repository import WebKit # Heavy, only loaded if the user wants it
         web_content = WebKit.WebView()
         settings = web_content.get_settings()
         settings.set_property('enable-default-context-menu', False)
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+# ANoise 0.0.29 (Ambient Noise)
+# Copyright (C) 2015 Marcos Alvarez Costales https://launchpad.net/~costales
+#
+# ANoise is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# ANoise is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ANoise; if not, see http://www.gnu.org/licenses
+# for more information.
+
+import threading, gi
+gi.require_version('Gst', '1.0')
+gi.require_version('GstPbutils', '1.0')
+from gi.repository import Gst, GstPbutils, GLib
+from pool import FilePool
+import archive
+
+
+class Prober(FilePool):
+    """Check new sound files with Discoverer in a few background threads"""
+    def __init__(self, callback, workers=4, timeout=10):
+        FilePool.__init__(self, callback, workers) # Called from the main loop with (filename, info)
+        self._local = threading.local()
+        self.TIMEOUT = timeout
+
+    def probe(self, filenames):
+        """Queue sound files to be probed"""
+        self.queue(filenames)
+
+    def _work(self, filename):
+        discoverer = getattr(self._local, 'discoverer', None)
+        if discoverer is None:
+            discoverer = GstPbutils.Discoverer.new(self.TIMEOUT * Gst.SECOND)
+            self._local.discoverer = discoverer
+            self._local.archived = [None, None] # Sound in an archive being probed, and its ArchiveSource
+            discoverer.connect('source-setup', self._on_source_setup, self._local.archived)
+
+        info = {'valid': 0, 'duration': None, 'codec': None, 'rate': None}
+        try:
+            if archive.is_archived(filename):
+                # Read out of the archive through an appsrc, as the player does
+                self._local.archived[0] = filename
+                uri = 'appsrc://'
+            else:
+                uri = Gst.filename_to_uri(filename)
+            result = discoverer.discover_uri(uri)
+            streams = result.get_audio_streams()
+            if result.get_result() == GstPbutils.DiscovererResult.OK and streams:
+                caps = streams[0].get_caps()
+                info['valid'] = 1
+                info['duration'] = result.get_duration()
+                info['codec'] = GstPbutils.pb_utils_get_codec_description(caps) or caps.to_string()
+                info['rate'] = streams[0].get_sample_rate()
+        except GLib.Error:
+            pass # Broken or unsupported: stays not valid
+        finally:
+            if self._local.archived[1] is not None:
+                self._local.archived[1].close()
+            self._local.archived[:] = [None, None]
+        return info
+
+    def _on_source_setup(self, discoverer, source, archived):
+        if archived[0] is None:
+            return
+        try:
+            archived[1] = archive.ArchiveSource(source, archived[0])
+        except archive.Error:
+            source.emit('end-of-stream') # Gone or broken archive: fails now, not at the timeout
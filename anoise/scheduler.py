@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+# ANoise 0.0.29 (Ambient Noise)
+# Copyright (C) 2015 Marcos Alvarez Costales https://launchpad.net/~costales
+#
+# ANoise is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# ANoise is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ANoise; if not, see http://www.gnu.org/licenses
+# for more information.
+
+import time, math
+from gi.repository import GLib
+
+
+class Scheduler:
+    """Named timers and ramps on the main loop: no threads, and a name replaces or cancels its job"""
+    def __init__(self, ramp_step=50):
+        self.RAMP_STEP = ramp_step # ms between values of a ramp
+        self._jobs = {} # Name > (GLib source, monotonic time it ends)
+
+    def schedule(self, name, seconds, callback, *args):
+        """Call callback(*args) in some seconds"""
+        self.cancel(name)
+        if seconds >= 10:
+            # Long timers only need a second precision, GLib wakes up once for all of them
+            source = GLib.timeout_add_seconds(int(round(seconds)), self._run, name, callback, args)
+        else:
+            source = GLib.timeout_add(int(seconds * 1000), self._run, name, callback, args)
+        self._jobs[name] = (source, time.monotonic() + seconds)
+
+    def ramp(self, name, setter, start, end, seconds, done=None):
+        """Call setter from start to end values over some seconds (equal power curve), then done()"""
+        self.cancel(name)
+        steps = max(1, int(seconds * 1000 / self.RAMP_STEP))
+        source = GLib.timeout_add(self.RAMP_STEP, self._ramp_step, name, setter, start, end, steps, done, [0])
+        self._jobs[name] = (source, time.monotonic() + seconds)
+
+    def cancel(self, name):
+        """Cancel a job, True if it was pending"""
+        job = self._jobs.pop(name, None)
+        if job is None:
+            return False
+        GLib.source_remove(job[0])
+        return True
+
+    def get_remaining(self, name):
+        """Seconds until a job ends, None if there is no such job"""
+        job = self._jobs.get(name)
+        if job is None:
+            return None
+        return max(0.0, job[1] - time.monotonic())
+
+    def get_jobs(self):
+        """Pending jobs, name > seconds until they end"""
+        return dict((name, self.get_remaining(name)) for name in self._jobs)
+
+    def _run(self, name, callback, args):
+        self._jobs.pop(name, None)
+        callback(*args)
+        return False
+
+    def _ramp_step(self, name, setter, start, end, steps, done, step):
+        step[0] += 1
+        position = min(1.0, float(step[0]) / steps)
+        if end >= start:
+            curve = math.sin(position * math.pi / 2)
+        else:
+            curve = 1.0 - math.cos(position * math.pi / 2)
+        setter(start + (end - start) * curve)
+        if position < 1.0:
+            return True
+        self._jobs.pop(name, None)
+        if done is not None:
+            done()
+        return False
@@ -86,11 +86,30 @@ _sound_menu_previous
 _sound_menu_is_playing
 _sound_menu_play
 _sound_menu_pause
+_sound_menu_stats
+_sound_menu_track
+_sound_menu_goto
+_sound_menu_set_cache_budget
+_sound_menu_add_layer
+_sound_menu_remove_layer
+_sound_menu_set_layer_volume
+_sound_menu_layers
+_sound_menu_set_crossfade
+_sound_menu_set_sleep_timer
+_sound_menu_set_wake_up
+_sound_menu_schedule_noise
+_sound_menu_cancel_timer
+_sound_menu_timers
+_sound_menu_set_power_profile
 
 """
 
 import dbus
 import dbus.service
+from gi.repository import GLib
+
+STATS_IFACE = 'net.launchpad.anoise.Stats'
+CONTROL_IFACE = 'net.launchpad.anoise.Control' # What MPRIS has no method for
 
 class SoundMenuControls(dbus.service.Object):
     """
@@ -118,9 +137,56 @@ class SoundMenuControls(dbus.service.Object):
         dbus.service.Object.__init__(self, bus_name, "/org/mpris/MediaPlayer2")
         self.__playback_status = "Stopped"
         self.__loop_status = "Track"
+        # What Get and GetAll serve, updated only when something changes
+        self.__properties = {
+            'org.mpris.MediaPlayer2': {
+                'CanQuit':      False,
+                'CanRaise':     True,
+                'CanGoNext':    True,
+                'CanGoPrevious':True,
+                'HasTrackList': True,
+                'DesktopEntry': self.desktop_name,
+                'Identity':     self.identity,
+            }, # Fixed #1440061
+            'org.mpris.MediaPlayer2.Player': {
+                'CanControl':    True,
+                'CanPlay':       True,
+                'CanPause':      True,
+                'CanGoNext':     True,
+                'CanGoPrevious': True,
+                'PlaybackStatus':self.__playback_status,
+                'LoopStatus':    self.__loop_status,
+            },
+            'org.mpris.MediaPlayer2.TrackList': {
+                'Tracks':        dbus.Array([], signature='o'),
+                'CanEditTracks': False,
+            },
+        }
+        self.__track_count = 0
+        self.__track_metadata = {} # Track path > metadata, built the first time it's asked
+        self.__changed = {} # Interface > properties changed since the last PropertiesChanged
+        self.__emit_source = None
 
         self.song_changed( 0 )
 
+    def _set_properties(self, interface, **properties):
+        """Update properties, listeners get every change of one main loop iteration in one signal"""
+        table = self.__properties[interface]
+        for name, value in properties.items():
+            if name in table and table[name] == value:
+                continue
+            table[name] = value
+            self.__changed.setdefault(interface, {})[name] = value
+        if self.__changed and self.__emit_source is None:
+            self.__emit_source = GLib.idle_add(self.__emit_properties_changed)
+
+    def __emit_properties_changed(self):
+        self.__emit_source = None
+        changed, self.__changed = self.__changed, {}
+        for interface, properties in changed.items():
+            self.PropertiesChanged(interface, dbus.Dictionary(properties, "sv", variant_level=1), [])
+        return False
+
     def song_changed(self, trackid, artists = None, album = None, title = None, album_art = None, filename = None):
         """song_changed - sets the info for the current song.
 
@@ -137,7 +203,24 @@ class SoundMenuControls(dbus.service.Object):
             filename - a string of the uri for the filename
 
         """
-        trackid = dbus.ObjectPath("/".join(["/org", self.desktop_name, "playlist", str(trackid)]))
+        self.__meta_data = self._make_metadata(self._get_track_path(trackid), artists, album, title,
+                                               album_art, filename)
+        self._set_properties("org.mpris.MediaPlayer2.Player", Metadata=self.__meta_data)
+
+    def _get_track_path(self, trackid):
+        return dbus.ObjectPath("/".join(["/org", self.desktop_name, "playlist", str(trackid)]))
+
+    def _get_track_index(self, track):
+        """Index of a track path in the tracklist, None if it isn't one of ours"""
+        try:
+            index = int(track.rsplit("/", 1)[1])
+        except (IndexError, ValueError):
+            return None
+        if track != self._get_track_path(index) or not 0 <= index < self.__track_count:
+            return None
+        return index
+
+    def _make_metadata(self, trackid, artists = None, album = None, title = None, album_art = None, filename = None):
         if artists is None:
             artists = ["Artist Unknown"]
         if album is None:
@@ -149,7 +232,7 @@ class SoundMenuControls(dbus.service.Object):
         if filename is None:
             filename = ""
 
-        self.__meta_data = dbus.Dictionary({
+        return dbus.Dictionary({
                             "mpris:trackid":trackid,
                             "xesam:url":filename,
                             "xesam:album":album,
@@ -158,8 +241,112 @@ class SoundMenuControls(dbus.service.Object):
                             "mpris:artUrl":album_art,
                             }, "sv", variant_level=1)
 
-        d = dbus.Dictionary({"Metadata":self.__meta_data}, "sv",variant_level=1)
-        self.PropertiesChanged("org.mpris.MediaPlayer2.Player",d,[])
+    def tracks_changed(self, count, current):
+        """tracks_changed - sets the tracklist.
+
+        This method is not typically overridden. It should be called
+        by implementations of this class when the list of songs changed.
+
+        named arguments:
+            count - the number of songs, the track ids go from 0 to count - 1
+            current - the track id of the current song
+
+        """
+        self.__track_count = count
+        self.__track_metadata = {}
+        tracks = dbus.Array([self._get_track_path(i) for i in range(count)], signature='o')
+        self.__properties['org.mpris.MediaPlayer2.TrackList']['Tracks'] = tracks
+        self.TrackListReplaced(tracks, self._get_track_path(current))
+
+    @dbus.service.method('org.mpris.MediaPlayer2.TrackList', in_signature='ao', out_signature='aa{sv}')
+    def GetTracksMetadata(self, tracks):
+        """GetTracksMetadata
+
+        D-Bus method returning the metadata of some tracks. Do not override
+        this function, instead override _sound_menu_track.
+
+        """
+
+        metadata = dbus.Array([], signature='a{sv}')
+        for track in tracks:
+            if track not in self.__track_metadata:
+                index = self._get_track_index(track)
+                info = None if index is None else self._sound_menu_track(index)
+                if info is None:
+                    continue
+                self.__track_metadata[track] = self._make_metadata(self._get_track_path(index), *info)
+            metadata.append(self.__track_metadata[track])
+        return metadata
+
+    def _sound_menu_track(self, trackid):
+        """_sound_menu_track
+
+        Override this function to return the info of a song of the
+        tracklist, as the (artists, album, title, album_art, filename)
+        arguments of song_changed. It is called once per song until
+        the next tracks_changed.
+
+        The default implementation returns None, no info.
+
+        """
+
+        return None
+
+    @dbus.service.method('org.mpris.MediaPlayer2.TrackList', in_signature='o')
+    def GoTo(self, track):
+        """GoTo
+
+        D-Bus method to play a track of the tracklist. Do not override
+        this function, instead override _sound_menu_goto.
+
+        """
+
+        index = self._get_track_index(track)
+        if index is not None:
+            self._sound_menu_goto(index)
+
+    def _sound_menu_goto(self, trackid):
+        """_sound_menu_goto
+
+        Called when the user picked a song of the tracklist.
+        Implementations should override this function to play it,
+        calling song_changed() to keep the song information in sync.
+
+        The default implementation of this function has no effect.
+
+        """
+
+        pass
+
+    @dbus.service.method('org.mpris.MediaPlayer2.TrackList', in_signature='sob')
+    def AddTrack(self, uri, after_track, set_as_current):
+        """AddTrack
+
+        The tracklist can't be edited (CanEditTracks is False), it does nothing.
+
+        """
+
+        pass
+
+    @dbus.service.method('org.mpris.MediaPlayer2.TrackList', in_signature='o')
+    def RemoveTrack(self, track):
+        """RemoveTrack
+
+        The tracklist can't be edited (CanEditTracks is False), it does nothing.
+
+        """
+
+        pass
+
+    @dbus.service.signal('org.mpris.MediaPlayer2.TrackList', signature='aoo')
+    def TrackListReplaced(self, tracks, current_track):
+        """TrackListReplaced
+
+        D-Bus signal sent by tracks_changed, the whole tracklist changed.
+
+        """
+
+        pass
 
 
     @dbus.service.method('org.mpris.MediaPlayer2')
@@ -186,6 +373,316 @@ class SoundMenuControls(dbus.service.Object):
                                       is not implemented by this player.""")
 
 
+    @dbus.service.method(STATS_IFACE, out_signature='a{sv}')
+    def GetStats(self):
+        """GetStats
+
+        Health statistics of the player, for monitoring. Do not override
+        this function, instead override _sound_menu_stats.
+
+        """
+
+        return dbus.Dictionary(self._sound_menu_stats(), signature='sv')
+
+    def _sound_menu_stats(self):
+        """_sound_menu_stats
+
+        Override this function to return the statistics of the player,
+        a dictionary of names to numbers or lists of numbers.
+
+        The default implementation returns no statistics.
+
+        """
+
+        return {}
+
+    @dbus.service.method(CONTROL_IFACE, in_signature='t')
+    def SetCacheBudget(self, max_bytes):
+        """SetCacheBudget
+
+        D-Bus method to set the disk space for decoded sounds, in bytes.
+        Do not override this function, instead override
+        _sound_menu_set_cache_budget.
+
+        """
+
+        self._sound_menu_set_cache_budget(int(max_bytes))
+
+    def _sound_menu_set_cache_budget(self, max_bytes):
+        """_sound_menu_set_cache_budget
+
+        Override this function to change the disk space of the cache.
+
+        The default implementation of this function has no effect.
+
+        """
+
+        pass
+
+    @dbus.service.method(CONTROL_IFACE, in_signature='od')
+    def AddLayer(self, track, volume):
+        """AddLayer
+
+        D-Bus method to mix a track of the tracklist over the playing one,
+        at a volume from 0.0 to 1.0. Do not override this function,
+        instead override _sound_menu_add_layer.
+
+        """
+
+        index = self._get_track_index(track)
+        if index is not None:
+            self._sound_menu_add_layer(index, float(volume))
+
+    def _sound_menu_add_layer(self, trackid, volume):
+        """_sound_menu_add_layer
+
+        Override this function to mix a song of the tracklist over the playing one.
+
+        The default implementation of this function has no effect.
+
+        """
+
+        pass
+
+    @dbus.service.method(CONTROL_IFACE, in_signature='o')
+    def RemoveLayer(self, track):
+        """RemoveLayer
+
+        D-Bus method to stop mixing a track. Do not override this function,
+        instead override _sound_menu_remove_layer.
+
+        """
+
+        index = self._get_track_index(track)
+        if index is not None:
+            self._sound_menu_remove_layer(index)
+
+    def _sound_menu_remove_layer(self, trackid):
+        """_sound_menu_remove_layer
+
+        Override this function to stop mixing a song of the tracklist.
+
+        The default implementation of this function has no effect.
+
+        """
+
+        pass
+
+    @dbus.service.method(CONTROL_IFACE, in_signature='od')
+    def SetLayerVolume(self, track, volume):
+        """SetLayerVolume
+
+        D-Bus method to change the volume of a mixed track. Do not override
+        this function, instead override _sound_menu_set_layer_volume.
+
+        """
+
+        index = self._get_track_index(track)
+        if index is not None:
+            self._sound_menu_set_layer_volume(index, float(volume))
+
+    def _sound_menu_set_layer_volume(self, trackid, volume):
+        """_sound_menu_set_layer_volume
+
+        Override this function to change the volume of a mixed song.
+
+        The default implementation of this function has no effect.
+
+        """
+
+        pass
+
+    @dbus.service.method(CONTROL_IFACE, out_signature='a{od}')
+    def GetLayers(self):
+        """GetLayers
+
+        D-Bus method returning the mixed tracks and their volumes. Do not
+        override this function, instead override _sound_menu_layers.
+
+        """
+
+        return dbus.Dictionary(dict((self._get_track_path(trackid), volume)
+            for trackid, volume in self._sound_menu_layers().items()), signature='od')
+
+    def _sound_menu_layers(self):
+        """_sound_menu_layers
+
+        Override this function to return the mixed songs, a dictionary
+        of tracklist indexes to volumes.
+
+        The default implementation returns no layers.
+
+        """
+
+        return {}
+
+    @dbus.service.method(CONTROL_IFACE, in_signature='d')
+    def SetCrossfade(self, seconds):
+        """SetCrossfade
+
+        D-Bus method to crossfade next and previous over some seconds,
+        0 switches at once. Do not override this function, instead
+        override _sound_menu_set_crossfade.
+
+        """
+
+        self._sound_menu_set_crossfade(max(0.0, float(seconds)))
+
+    def _sound_menu_set_crossfade(self, seconds):
+        """_sound_menu_set_crossfade
+
+        Override this function to crossfade songs when they change.
+
+        The default implementation of this function has no effect.
+
+        """
+
+        pass
+
+    @dbus.service.method(CONTROL_IFACE, in_signature='d')
+    def SetSleepTimer(self, seconds):
+        """SetSleepTimer
+
+        D-Bus method to fade out and pause after some seconds, 0 cancels
+        the sleep timer. Do not override this function, instead override
+        _sound_menu_set_sleep_timer.
+
+        """
+
+        self._sound_menu_set_sleep_timer(max(0.0, float(seconds)))
+
+    def _sound_menu_set_sleep_timer(self, seconds):
+        """_sound_menu_set_sleep_timer
+
+        Override this function to stop playing after some seconds, 0 cancels it.
+
+        The default implementation of this function has no effect.
+
+        """
+
+        pass
+
+    @dbus.service.method(CONTROL_IFACE, in_signature='d')
+    def SetWakeUp(self, seconds):
+        """SetWakeUp
+
+        D-Bus method to start playing, fading in, after some seconds, 0
+        cancels it. Do not override this function, instead override
+        _sound_menu_set_wake_up.
+
+        """
+
+        self._sound_menu_set_wake_up(max(0.0, float(seconds)))
+
+    def _sound_menu_set_wake_up(self, seconds):
+        """_sound_menu_set_wake_up
+
+        Override this function to start playing after some seconds, 0 cancels it.
+
+        The default implementation of this function has no effect.
+
+        """
+
+        pass
+
+    @dbus.service.method(CONTROL_IFACE, in_signature='od')
+    def ScheduleNoise(self, track, seconds):
+        """ScheduleNoise
+
+        D-Bus method to go to a track of the tracklist after some seconds.
+        Do not override this function, instead override
+        _sound_menu_schedule_noise.
+
+        """
+
+        index = self._get_track_index(track)
+        if index is not None:
+            self._sound_menu_schedule_noise(index, max(0.0, float(seconds)))
+
+    def _sound_menu_schedule_noise(self, trackid, seconds):
+        """_sound_menu_schedule_noise
+
+        Override this function to change to a song of the tracklist after some seconds.
+
+        The default implementation of this function has no effect.
+
+        """
+
+        pass
+
+    @dbus.service.method(CONTROL_IFACE, in_signature='s', out_signature='b')
+    def CancelTimer(self, name):
+        """CancelTimer
+
+        D-Bus method to cancel a timer by the name GetTimers lists it with,
+        False if there was no such timer. Do not override this function,
+        instead override _sound_menu_cancel_timer.
+
+        """
+
+        return bool(self._sound_menu_cancel_timer(str(name)))
+
+    def _sound_menu_cancel_timer(self, name):
+        """_sound_menu_cancel_timer
+
+        Override this function to cancel a timer, returning if it was pending.
+
+        The default implementation cancels nothing.
+
+        """
+
+        return False
+
+    @dbus.service.method(CONTROL_IFACE, out_signature='a{sd}')
+    def GetTimers(self):
+        """GetTimers
+
+        D-Bus method returning the pending timers and fades, names to
+        seconds until they end. Do not override this function, instead
+        override _sound_menu_timers.
+
+        """
+
+        return dbus.Dictionary(self._sound_menu_timers(), signature='sd')
+
+    def _sound_menu_timers(self):
+        """_sound_menu_timers
+
+        Override this function to return the pending timers, a dictionary
+        of names to seconds.
+
+        The default implementation returns no timers.
+
+        """
+
+        return {}
+
+    @dbus.service.method(CONTROL_IFACE, in_signature='s')
+    def SetPowerProfile(self, name):
+        """SetPowerProfile
+
+        D-Bus method to choose the power profile used from the next start,
+        'normal' or 'low-power'. Do not override this function, instead
+        override _sound_menu_set_power_profile.
+
+        """
+
+        if not self._sound_menu_set_power_profile(str(name)):
+            raise dbus.exceptions.DBusException("No such power profile %s" % name,
+                                                name="org.freedesktop.DBus.Error.InvalidArgs")
+
+    def _sound_menu_set_power_profile(self, name):
+        """_sound_menu_set_power_profile
+
+        Override this function to save the power profile, returning
+        False if there is no profile with that name.
+
+        The default implementation knows no profile.
+
+        """
+
+        return False
+
     @dbus.service.method(dbus.PROPERTIES_IFACE, in_signature='ss', out_signature='v')
     def Get(self, interface, prop):
         """Get
@@ -197,8 +694,13 @@ class SoundMenuControls(dbus.service.Object):
 
         """
 
-        my_prop = self.__getattribute__(prop)
-        return my_prop
+        if prop in self.__properties.get(interface, {}):
+            return self.__properties[interface][prop]
+        for properties in self.__properties.values():
+            if prop in properties:
+                return properties[prop]
+        raise dbus.exceptions.DBusException("No such property %s" % prop,
+                                            name="org.freedesktop.DBus.Error.InvalidArgs")
 
     @dbus.service.method(dbus.PROPERTIES_IFACE, in_signature='ssv')
     def Set(self, interface, prop, value):
@@ -223,15 +725,7 @@ class SoundMenuControls(dbus.service.Object):
         be overridden or called directly.
 
         """
-        return {
-            'CanQuit':      False,
-            'CanRaise':     True,
-            'CanGoNext':    True,
-            'CanGoPrevious':True,
-            'HasTrackList': False,
-            'DesktopEntry': self.desktop_name,
-            'Identity':     self.identity,
-        } # Fixed #1440061
+        return self.__properties.get(interface, self.__properties['org.mpris.MediaPlayer2'])
 
     @property
     def CanControl(self):
@@ -413,9 +907,8 @@ class SoundMenuControls(dbus.service.Object):
         """
 
         self.__playback_status = "Playing"
-        d = dbus.Dictionary({"PlaybackStatus":self.__playback_status, "LoopStatus":self.__loop_status},
-                             "sv",variant_level=1)
-        self.PropertiesChanged("org.mpris.MediaPlayer2.Player",d,[])
+        self._set_properties("org.mpris.MediaPlayer2.Player",
+                             PlaybackStatus=self.__playback_status, LoopStatus=self.__loop_status)
 
     def signal_paused(self):
         """signal_paused - Tell the Sound Menu that the player has
@@ -428,9 +921,8 @@ class SoundMenuControls(dbus.service.Object):
         """
 
         self.__playback_status = "Paused"
-        d = dbus.Dictionary({"PlaybackStatus":self.__playback_status, "LoopStatus":self.__loop_status},
-                             "sv", variant_level=1)
-        self.PropertiesChanged("org.mpris.MediaPlayer2.Player",d,[])
+        self._set_properties("org.mpris.MediaPlayer2.Player",
+                             PlaybackStatus=self.__playback_status, LoopStatus=self.__loop_status)
 
     def signal_stopped(self):
         """signal_stopped - Tell the Sound Menu that the player has
@@ -443,9 +935,8 @@ class SoundMenuControls(dbus.service.Object):
         """
 
         self.__playback_status = "Stopped"
-        d = dbus.Dictionary({"PlaybackStatus":self.__playback_status, "LoopStatus":self.__loop_status},
-                             "sv", variant_level=1)
-        self.PropertiesChanged("org.mpris.MediaPlayer2.Player",d,[])
+        self._set_properties("org.mpris.MediaPlayer2.Player",
+                             PlaybackStatus=self.__playback_status, LoopStatus=self.__loop_status)
 
     def _sound_menu_is_playing(self):
         """_sound_menu_is_playing
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+# ANoise 0.0.29 (Ambient Noise)
+# Copyright (C) 2015 Marcos Alvarez Costales https://launchpad.net/~costales
+#
+# ANoise is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# ANoise is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ANoise; if not, see http://www.gnu.org/licenses
+# for more information.
+
+import os, json, atexit
+from gi.repository import GLib
+
+
+class StateStore:
+    """What ANoise remembers, written behind: changes wait a moment and go to disk together, atomically"""
+    def __init__(self, filename, delay=2000):
+        self.filename = filename
+        self.DELAY = delay # ms
+        self._state = self._read()
+        self._source = None
+        self._dirty = False
+        atexit.register(self.flush)
+
+    def _read(self):
+        try:
+            with open(self.filename, 'r') as state_file:
+                state = json.load(state_file)
+        except (IOError, OSError, ValueError):
+            return {}
+        if isinstance(state, int):
+            return {'current': state} # Old config: only the index of the current noise
+        if not isinstance(state, dict):
+            return {}
+        return state
+
+    def get(self, key, default=None):
+        return self._state.get(key, default)
+
+    def set(self, **values):
+        """Change some values, they are saved a bit later"""
+        changed = False
+        for key, value in values.items():
+            if self._state.get(key) != value:
+                self._state[key] = value
+                changed = True
+        self._dirty = self._dirty or changed
+        if changed and self._source is None:
+            self._source = GLib.timeout_add(self.DELAY, self._on_timeout)
+
+    def _on_timeout(self):
+        self._source = None
+        self.flush()
+        return False
+
+    def flush(self):
+        """Save now if there are changes waiting"""
+        if self._source is not None:
+            GLib.source_remove(self._source)
+            self._source = None
+        if not self._dirty:
+            return
+        self._dirty = False
+        partial = self.filename + '.tmp'
+        try:
+            with open(partial, 'w') as state_file:
+                json.dump(self._state, state_file, indent=1, sort_keys=True)
+                state_file.flush()
+                os.fsync(state_file.fileno())
+            os.replace(partial, self.filename) # Atomic, a crash leaves the old file or the new one
+        except (IOError, OSError):
+            pass
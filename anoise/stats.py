@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+# ANoise 0.0.29 (Ambient Noise)
+# Copyright (C) 2015 Marcos Alvarez Costales https://launchpad.net/~costales
+#
+# ANoise is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# ANoise is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ANoise; if not, see http://www.gnu.org/licenses
+# for more information.
+
+import time, bisect, threading, gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+
+class Histogram:
+    """Latencies counted in fixed buckets, nothing kept per sample"""
+    BOUNDS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000) # ms, the last bucket is over 2 s
+
+    def __init__(self):
+        self.buckets = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        ms = seconds * 1000
+        self.buckets[bisect.bisect_left(self.BOUNDS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+
+class Stats:
+    """Health of the playback: bus problems and latency histograms, cheap enough to be always on"""
+    COUNTERS = ('qos_messages', 'qos_dropped', 'warnings', 'errors', 'state_changes', 'loops')
+    HISTOGRAMS = ('state_change', 'loop', 'skip')
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.counters = dict((name, 0) for name in self.COUNTERS)
+        self.histograms = dict((name, Histogram()) for name in self.HISTOGRAMS)
+        self._requested = {} # Element > when its last state change was asked
+        self._lock = threading.Lock() # Skips and loops are measured in the streaming threads
+
+    def watch(self, pipeline):
+        """Count what this pipeline posts on its bus"""
+        bus = pipeline.get_bus()
+        bus.add_signal_watch() # Refcounted, fine if someone else watches it too
+        bus.connect('message::qos', self._on_qos)
+        bus.connect('message::warning', self._on_count, 'warnings')
+        bus.connect('message::error', self._on_count, 'errors')
+        bus.connect('message::state-changed', self._on_state_changed, pipeline)
+
+    def set_state(self, element, state):
+        """Change the state of a watched pipeline, timing how long it takes"""
+        if element.get_state(0)[1] != state: # No message when it's there already
+            self._requested[element] = time.monotonic()
+        return element.set_state(state)
+
+    def add(self, name, seconds):
+        """One more latency in a histogram"""
+        with self._lock:
+            self.histograms[name].add(seconds)
+
+    def loop_done(self, ended):
+        """A loop went back to its start (streaming thread), timed from the Gst timestamp its segment ended at"""
+        seconds = max(0, Gst.util_get_timestamp() - ended) / float(Gst.SECOND)
+        with self._lock:
+            self.counters['loops'] += 1
+            self.histograms['loop'].add(seconds)
+
+    def _on_qos(self, bus, message):
+        self.counters['qos_messages'] += 1
+        dropped = message.parse_qos_stats()[2]
+        if dropped > 0:
+            self.counters['qos_dropped'] += dropped
+
+    def _on_count(self, bus, message, name):
+        self.counters[name] += 1
+
+    def _on_state_changed(self, bus, message, pipeline):
+        if message.src != pipeline:
+            return
+        pending = message.parse_state_changed()[2]
+        if pending != Gst.State.VOID_PENDING:
+            return
+        self.counters['state_changes'] += 1
+        requested = self._requested.pop(pipeline, None)
+        if requested is not None:
+            self.add('state_change', time.monotonic() - requested)
+
+    def get(self):
+        """Everything as a flat dictionary of numbers and lists of numbers"""
+        with self._lock:
+            stats = dict(self.counters)
+        stats['uptime_s'] = time.monotonic() - self.started
+        stats['bucket_bounds_ms'] = list(Histogram.BOUNDS)
+        with self._lock:
+            for name, histogram in self.histograms.items():
+                stats[name + '_count'] = histogram.count
+                stats[name + '_mean_ms'] = histogram.total / histogram.count if histogram.count else 0.0
+                stats[name + '_max_ms'] = histogram.max
+                stats[name + '_buckets'] = list(histogram.buckets)
+        return stats
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+# ANoise 0.0.29 (Ambient Noise)
+# Copyright (C) 2015 Marcos Alvarez Costales https://launchpad.net/~costales
+#
+# ANoise is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# ANoise is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ANoise; if not, see http://www.gnu.org/licenses
+# for more information.
+
+"""Serve what ANoise plays to other rooms: encoded once, sent to every listener"""
+
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst, Gio, GLib
+import power
+
+CAPS = 'audio/x-raw,format=S16LE,layout=interleaved,rate=48000,channels=2'
+# multisocketsink enums, not in the introspection data
+FORMAT_BYTES = 2
+RECOVER_LATEST = 1
+
+
+def make_audio_sink(server=None, local=True, profile=power.DEFAULT):
+    """Output of a pipeline: the speakers (buffered as the power profile says), and the stream too when there is a server"""
+    if local:
+        sink = Gst.ElementFactory.make('autoaudiosink', None)
+        power.configure_sink(sink, profile)
+    else:
+        sink = Gst.ElementFactory.make('fakesink', None)
+        sink.set_property('sync', True) # Still in real time, to the pipeline clock
+    if server is None:
+        return sink
+
+    output = Gst.Bin.new(None)
+    tee = Gst.ElementFactory.make('tee', None)
+    local_queue = Gst.ElementFactory.make('queue', None)
+    stream_queue = Gst.ElementFactory.make('queue', None)
+    stream_queue.set_property('leaky', 2) # Downstream: the speakers never wait for the stream
+    convert = Gst.ElementFactory.make('audioconvert', None)
+    resample = Gst.ElementFactory.make('audioresample', None)
+    caps = Gst.ElementFactory.make('capsfilter', None)
+    caps.set_property('caps', Gst.Caps.from_string(CAPS))
+    appsink = Gst.ElementFactory.make('appsink', None)
+    appsink.set_property('sync', False)
+    appsink.set_property('emit-signals', True)
+    appsink.connect('new-sample', server.push_sample)
+    for element in (tee, local_queue, sink, stream_queue, convert, resample, caps, appsink):
+        output.add(element)
+    tee.link(local_queue)
+    local_queue.link(sink)
+    tee.link(stream_queue)
+    stream_queue.link(convert)
+    convert.link(resample)
+    resample.link(caps)
+    caps.link(appsink)
+    output.add_pad(Gst.GhostPad.new('sink', tee.get_static_pad('sink')))
+    return output
+
+
+class StreamServer:
+    """Ogg Opus over HTTP: one encoder, its output fanned out to every client by multisocketsink"""
+    def __init__(self, port=8000, bitrate=96000, client_bytes=256 * 1024):
+        self.port = port
+        self.pipeline = Gst.Pipeline.new('stream')
+        self.source = Gst.ElementFactory.make('appsrc', None)
+        self.source.set_property('caps', Gst.Caps.from_string(CAPS))
+        self.source.set_property('format', Gst.Format.TIME)
+        self.source.set_property('is-live', True)
+        self.source.set_property('do-timestamp', True)
+        self.source.set_property('max-bytes', 64 * 1024)
+        self.source.set_property('block', False)
+        convert = Gst.ElementFactory.make('audioconvert', None)
+        encoder = Gst.ElementFactory.make('opusenc', None)
+        encoder.set_property('bitrate', bitrate)
+        mux = Gst.ElementFactory.make('oggmux', None)
+        self.sink = Gst.ElementFactory.make('multisocketsink', None)
+        self.sink.set_property('sync', False)
+        # Per client: over the soft limit it skips to the latest data, over the hard one it's dropped
+        self.sink.set_property('unit-format', FORMAT_BYTES)
+        self.sink.set_property('units-soft-max', client_bytes // 2)
+        self.sink.set_property('units-max', client_bytes)
+        self.sink.set_property('recover-policy', RECOVER_LATEST)
+        self.sink.connect('client-socket-removed', self._on_client_removed)
+        for element in (self.source, convert, encoder, mux, self.sink):
+            self.pipeline.add(element)
+        self.source.link(convert)
+        convert.link(encoder)
+        encoder.link(mux)
+        mux.link(self.sink)
+
+        self._connections = {} # Socket > its connection, closed when the sink drops it
+        self.service = Gio.SocketService.new()
+        self.service.connect('incoming', self._on_incoming)
+
+    def start(self):
+        self.service.add_inet_port(self.port, None)
+        self.service.start()
+        self.pipeline.set_state(Gst.State.PLAYING)
+
+    def stop(self):
+        self.service.stop()
+        self.service.close()
+        self.pipeline.set_state(Gst.State.NULL)
+        for connection in self._connections.values():
+            connection.close(None)
+        self._connections.clear()
+
+    def get_clients(self):
+        return len(self._connections)
+
+    def push_sample(self, appsink):
+        """The playing audio, from a make_audio_sink branch (streaming thread)"""
+        sample = appsink.emit('pull-sample')
+        if sample is not None:
+            self.source.emit('push-buffer', sample.get_buffer())
+        return Gst.FlowReturn.OK
+
+    def _on_incoming(self, service, connection, source_object):
+        # The request doesn't matter, every path is the stream: read it without blocking the loop
+        connection.get_input_stream().read_bytes_async(4096, GLib.PRIORITY_DEFAULT, None,
+            self._on_request, connection)
+        return True
+
+    def _on_request(self, stream, result, connection):
+        try:
+            stream.read_bytes_finish(result)
+            connection.get_output_stream().write_all(b'HTTP/1.0 200 OK\r\n'
+                b'Content-Type: audio/ogg\r\nCache-Control: no-cache\r\n\r\n', None)
+        except GLib.Error:
+            connection.close(None)
+            return
+        socket = connection.get_socket()
+        self._connections[socket] = connection
+        self.sink.emit('add', socket)
+
+    def _on_client_removed(self, sink, socket):
+        # Signalled from the streaming thread
+        GLib.idle_add(self._close_client, socket)
+
+    def _close_client(self, socket):
+        connection = self._connections.pop(socket, None)
+        if connection is not None:
+            connection.close(None)
+        return False
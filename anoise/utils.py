@@ -16,12 +16,19 @@
 # along with ANoise; if not, see http://www.gnu.org/licenses
 # for more information.
 
-import os, glob, sys, socket, operator, gi
+import os, sys, socket, bisect, threading
 from watchdog.observers import Observer
-from watchdog.events import PatternMatchingEventHandler
-gi.require_version('Gtk', '3.0')
-from gi.repository import Gtk
+from watchdog.events import PatternMatchingEventHandler, EVENT_TYPE_CREATED, EVENT_TYPE_DELETED, EVENT_TYPE_MOVED
+from gi.repository import GLib
 from xdg import BaseDirectory
+from catalog import Catalog
+from probe import Prober
+from loudness import Loudness, get_factor
+from hasher import Hasher
+from state import StateStore
+from generators import GENERATED_PREFIX, COLORS, is_generated
+import generators
+import archive
 # i18n
 import gettext
 gettext.textdomain('anoise')
@@ -50,23 +57,166 @@ class NoisePathWatcher(PatternMatchingEventHandler):
     def __init__(self, noiseref):
         super(NoisePathWatcher, self).__init__()
         self._callback = noiseref
-        self._patterns = noiseref.SOUND_TYPES
+        self._patterns = noiseref.SOUND_TYPES + archive.ARCHIVE_TYPES
+        self.DEBOUNCE = 250   # ms to gather events before touching the listing
+        self.MAX_CHANGES = 64 # a bigger batch is cheaper as a full refresh
+        self.refreshes = 0
+        self._lock = threading.Lock()
+        self._changes = []
+        self._rescan = False
+        self._source = None
+
+    def dispatch(self, event):
+        # A folder of sounds copied, moved in or out matches no sound pattern, so it's caught before the filter
+        if event.is_directory and event.event_type in (EVENT_TYPE_CREATED, EVENT_TYPE_DELETED, EVENT_TYPE_MOVED):
+            self._queue(None) # The whole listing is checked again
+            return
+        super(NoisePathWatcher, self).dispatch(event)
 
     def on_deleted(self, event):
         # file was removed from DATA_DIR that we support, so update listing
-        self._callback.refresh_sound_files()
+        if archive.is_archive(event.src_path):
+            self._queue(None) # A pack: the whole listing is checked again
+        else:
+            self._queue(('remove', event.src_path))
 
     def on_created(self, event):
         # file was copied into DATA_DIR that we support, so update listing
-        self._callback.refresh_sound_files()
+        if archive.is_archive(event.src_path):
+            self._queue(None)
+        else:
+            self._queue(('add', event.src_path))
+
+    def on_modified(self, event):
+        # file was rewritten in place: its directory mtime doesn't change, so it's checked on its own
+        if not event.is_directory:
+            self._queue(('modify', event.src_path))
 
     def on_moved(self, event):
         # file was renamed inside DATA_DIR that we support, so update listing
-        self._callback.refresh_sound_files()
+        if archive.is_archive(event.src_path) or archive.is_archive(event.dest_path):
+            self._queue(None)
+        else:
+            self._queue(('move', event.src_path, event.dest_path))
+
+    def _queue(self, change):
+        # watchdog thread: only store it, the listing is changed from the main loop
+        with self._lock:
+            if change is None:
+                self._rescan = True
+            else:
+                self._changes.append(change)
+            if self._source is None:
+                self._source = GLib.timeout_add(self.DEBOUNCE, self._flush)
+
+    def _flush(self):
+        with self._lock:
+            changes, self._changes = self._changes, []
+            rescan, self._rescan = self._rescan, False
+            self._source = None
+
+        if rescan or len(changes) > self.MAX_CHANGES:
+            self._callback.refresh_sound_files([change[1] for change in changes if change[0] == 'modify'])
+        else:
+            self._callback.apply_sound_file_changes(changes)
+        self.refreshes += 1
+        return False
+
+class NoiseIndex:
+    """Noises sorted by name, updated by single changes instead of full rescans
+
+    A noise is keyed by its content hash: files with the same content are listed once, and
+    different files with the same name are all listed. Until it's hashed a file is its own key.
+    """
+    def __init__(self):
+        self._entries = []  # Sorted (name, key), the tracklist order
+        self._paths = {}    # Key > path playing for that content
+        self._hidden = {}   # Key > other paths with the same content
+        self._names = {}    # Path > name
+        self._keys = {}     # Path > key
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __getitem__(self, index):
+        name, key = self._entries[index]
+        return (name, self._paths[key])
+
+    def __contains__(self, path):
+        return path in self._keys
+
+    def load(self, noises):
+        """Replace the whole index from (name, path, hash) triples, latest path wins a content"""
+        self.__init__()
+        for name, path, key in noises:
+            key = key or path
+            self._names[path] = name
+            self._keys[path] = key
+            if key in self._paths:
+                self._hidden.setdefault(key, []).append(self._paths[key])
+            self._paths[key] = path
+        self._entries = sorted((self._names[path], key) for key, path in self._paths.items())
+
+    def add(self, name, path, key=None):
+        """Add a noise, False if it was there already"""
+        if path in self._keys:
+            return False
+        key = key or path
+        self._names[path] = name
+        self._keys[path] = key
+        if key in self._paths:
+            self._hidden.setdefault(key, []).append(self._paths[key])
+            self._remove_entry(key)
+        self._paths[key] = path
+        bisect.insort(self._entries, (name, key))
+        return True
+
+    def remove(self, path):
+        """Remove a noise, False if it wasn't there"""
+        key = self._keys.pop(path, None)
+        if key is None:
+            return False
+        hidden = self._hidden.get(key, [])
+        if self._paths[key] != path:
+            hidden.remove(path)
+        else:
+            self._remove_entry(key)
+            if hidden:
+                self._paths[key] = hidden.pop()
+                bisect.insort(self._entries, (self._names[self._paths[key]], key))
+            else:
+                del self._paths[key]
+        if not hidden:
+            self._hidden.pop(key, None)
+        del self._names[path]
+        return True
+
+    def set_key(self, path, key):
+        """The content hash of a noise is known, True if the tracklist changed (duplicates merged or split)"""
+        old_key = self._keys.get(path, key)
+        if old_key == key:
+            return False
+        # Merged into a listed content, or leaving one with other copies: another path shows
+        changed = key in self._paths or bool(self._hidden.get(old_key))
+        index = self.index(path)
+        name = self._names[path]
+        self.remove(path)
+        self.add(name, path, key)
+        return changed or self.index(path) != index # Same name, a new key can sort it elsewhere
+
+    def _remove_entry(self, key):
+        del self._entries[bisect.bisect_left(self._entries, (self._names[self._paths[key]], key))]
+
+    def index(self, path):
+        """Position of a noise in the tracklist (a duplicate is where its content is), -1 if it isn't listed"""
+        key = self._keys.get(path)
+        if key is None:
+            return -1
+        return bisect.bisect_left(self._entries, (self._names[self._paths[key]], key))
 
 class Noise:
     """Manage access to noises"""
-    def __init__(self):
+    def __init__(self, watch=True, background=True):
         self.CFG_DIR   = os.path.join(BaseDirectory.xdg_config_home, 'anoise')
         self.DATA_DIR  = os.path.join(BaseDirectory.xdg_data_home, 'anoise')
         self.CFG_FILE  = os.path.join(self.CFG_DIR, 'config')
@@ -80,8 +230,16 @@ class Noise:
         ]
         self.PATH_WATCHER = NoisePathWatcher( self )
         self.PATH_OBSERVER = None
-        self.noises = {}
-        self.current = self._get_cfg_last()
+        self.noises = NoiseIndex()
+        self.layers = {} # Filename > volume of the noises mixed over the current one
+        self.generation = 0 # Changes every time the listing changes
+        self.on_changed = None
+        self.on_gain = None # Called with a filename when its loudness gain is known
+        self.catalog = Catalog(self._get_title)
+        self.prober = Prober(self._on_probed)
+        self.loudness = Loudness(self._on_loudness)
+        self.hasher = Hasher(self._on_hashed)
+        self.background = background # Probe, analyze and hash the sound files, off for one-shot tools
 
         if not os.path.exists(self.CFG_DIR):
             try:
@@ -91,21 +249,28 @@ class Noise:
             except:
                 pass
 
-        self.refresh_sound_file_observers()
+        self.state = StateStore(self.CFG_FILE)
+        self.current = self.state.get('current', 0)
 
-        try:
-            self.BASE_ICON = Gtk.IconTheme.get_default().lookup_icon('anoise', 48, 0).get_filename()
-        except:
-            self.BASE_ICON = ''
+        # Watching can wait until the first noise plays: refresh_sound_file_observers()
+        if watch:
+            self.refresh_sound_file_observers()
+        else:
+            self._find_sound_paths()
+
+        self.BASE_ICON = None # Looked up in the icon theme the first time it's needed
 
         self.refresh_sound_files()
 
-    def refresh_sound_file_observers(self):
+    def _find_sound_paths(self):
         self.SOUND_PATHS = []
         for sound_path in self.DEFAULT_PATHS:
             if os.path.exists( sound_path ):
                   self.SOUND_PATHS.append( sound_path )
 
+    def refresh_sound_file_observers(self):
+        self._find_sound_paths()
+
         if self.PATH_OBSERVER is not None:
             self.PATH_OBSERVER.unschedule_all()
         else:
@@ -113,45 +278,167 @@ class Noise:
             self.PATH_OBSERVER.start()
 
         for sound_path in self.SOUND_PATHS:
-            self.PATH_OBSERVER.schedule(self.PATH_WATCHER, path=sound_path, recursive=False)
+            self.PATH_OBSERVER.schedule(self.PATH_WATCHER, path=sound_path, recursive=True) # Packs in subfolders
 
-    def refresh_sound_files(self):
-        """Get all current files in sounds paths"""
+    def refresh_sound_files(self, modified=()):
+        """Get all current files in sounds paths, the modified ones are cataloged again"""
         all_files = []
-        save_current_filename = None
-
-        if self.noises:
-            try:
-                save_current_filename = self.noises[self.current][1]
-            except:
-                pass
+        save_current_filename = self._get_current_filename_saved()
+        for filename in modified:
+            self.catalog.invalidate(os.path.dirname(filename))
 
         for sound_files in self.SOUND_PATHS:
-            available_sounds = glob.glob(os.path.join(sound_files, '*.*'))
-            for sound in available_sounds:
-                if ('*' + os.path.splitext(sound)[1].lower()) in self.SOUND_TYPES:
-                    all_files.append(sound)
+            all_files.extend(self.catalog.scan(sound_files, self.is_sound_file))
+
+        noises = [(_(self.catalog.get(noise)['title']), noise, self.catalog.get(noise)['hash']) for noise in all_files]
+        noises.extend(self._get_generated())
 
-        if not len(all_files):
+        if not len(noises):
             sys.exit(_('No noise files found'))
 
-        self.noises = {}
-        for noise in all_files:
-            self.noises[self.get_name(noise)] = noise
+        self.noises.load(noises)
+        self._restore_current(save_current_filename)
+        if not self.background:
+            return
+        self.prober.probe([noise for noise in all_files if self.catalog.get(noise)['valid'] is None])
+        self.loudness.analyze([noise for noise in all_files if self.catalog.get(noise)['gain'] is None])
+        self.hasher.hash([noise for noise in all_files if self.catalog.get(noise)['hash'] is None])
+
+    def apply_sound_file_changes(self, changes):
+        """Apply a batch of ('add', path), ('remove', path), ('modify', path) and ('move', src, dest) changes"""
+        if any(change[0] == 'modify' and archive.is_archive(change[1]) for change in changes):
+            # Every sound in a rewritten pack could have changed: its directory is listed again, with the other modified ones
+            self.refresh_sound_files([change[1] for change in changes if change[0] == 'modify'])
+            return
+        save_current_filename = self._get_current_filename_saved()
+        changed = False
+        for change in changes:
+            if change[0] == 'add':
+                changed = self._add_sound_file(change[1]) or changed
+            elif change[0] == 'remove':
+                changed = self._remove_sound_file(change[1]) or changed
+            elif change[0] == 'modify':
+                changed = self._modify_sound_file(change[1]) or changed
+            elif change[0] == 'move':
+                if save_current_filename == change[1] and self.is_sound_file(change[2]):
+                    save_current_filename = change[2] # Keep playing it under its new name
+                changed = self._remove_sound_file(change[1]) or changed
+                changed = self._add_sound_file(change[2]) or changed
+        if changed:
+            self._restore_current(save_current_filename)
+
+    def _get_generated(self):
+        """Noises synthesized on the fly, listed with the files"""
+        if not generators.is_available():
+            return []
+        titles = {'white': _("White Noise"), 'pink': _("Pink Noise"), 'brown': _("Brown Noise")}
+        return [(titles[color], ''.join([GENERATED_PREFIX, color]), None) for color in COLORS]
+
+    def _add_sound_file(self, filename):
+        if not self.is_sound_file(filename):
+            return False
+        row = self.catalog.add(filename)
+        if row is None:
+            return False
+        self._check_row(filename, row)
+        return self.noises.add(_(row['title']), filename, row['hash'])
+
+    def _modify_sound_file(self, filename):
+        if filename not in self.noises:
+            return self._add_sound_file(filename)
+        row = self.catalog.add(filename) # A new row if its mtime or size changed
+        if row is None:
+            return self._remove_sound_file(filename)
+        self._check_row(filename, row) # Listed as it is until its new hash comes
+        return False
+
+    def _check_row(self, filename, row):
+        # Probe, analyze and hash what isn't known yet about a sound file
+        if not self.background:
+            return
+        if row['valid'] is None:
+            self.prober.probe([filename])
+        if row['gain'] is None:
+            self.loudness.analyze([filename])
+        if row['hash'] is None:
+            self.hasher.hash([filename])
+
+    def _on_probed(self, filename, info):
+        self.catalog.update(filename, **info)
+
+    def _on_loudness(self, filename, gain):
+        self.catalog.update(filename, gain=gain)
+        if self.on_gain is not None:
+            self.on_gain(filename)
+
+    def _on_hashed(self, hashes):
+        # A batch of (filename, hash): duplicates found meanwhile are merged in one relisting
+        save_current_filename = self._get_current_filename_saved()
+        self.catalog.update_many([(filename, {'hash': digest, 'hash_mtime': mtime, 'hash_size': size})
+                                  for filename, (digest, mtime, size) in hashes])
+        changed = False
+        for filename, (digest, mtime, size) in hashes:
+            changed = self.noises.set_key(filename, digest) or changed
+        if changed:
+            self._restore_current(save_current_filename)
+
+    def get_hash(self, filename):
+        """Content hash of a sound file, None until it's hashed and again if it changed since (it's hashed again then)"""
+        row = self.catalog.get(filename)
+        if row is None:
+            return None
+        try:
+            st = os.stat(archive.split(filename)[0]) # The sound, or the archive it's in
+        except OSError:
+            return None
+        if row['hash'] is None or (row['hash_mtime'], row['hash_size']) != (st.st_mtime_ns, st.st_size):
+            self.hasher.hash([filename])
+            return None
+        return row['hash']
+
+    def get_gain(self, filename):
+        """Volume factor that brings a sound to the common loudness, 1.0 until it's analyzed"""
+        row = self.catalog.get(filename)
+        return get_factor(row['gain'] if row is not None else None)
+
+    def is_playable(self, index):
+        """Not known as broken (files still being probed are tried)"""
+        row = self.catalog.get(self.noises[index][1])
+        return row is None or row['valid'] != 0
+
+    def _remove_sound_file(self, filename):
+        self.catalog.remove(filename)
+        return self.noises.remove(filename)
+
+    def is_sound_file(self, filename):
+        """Supported sound file by its extension"""
+        return ('*' + os.path.splitext(filename)[1].lower()) in self.SOUND_TYPES
+
+    def _get_current_filename_saved(self):
+        if not len(self.noises):
+            return self.state.get('current_filename') # First listing: the one playing last time
+        try:
+            return self.noises[self.current][1]
+        except IndexError:
+            return None
 
-        self.noises = sorted(self.noises.items(), key=operator.itemgetter(0))
+    def _restore_current(self, save_current_filename):
         self.max = len(self.noises) - 1
+        self.generation += 1
 
         # we can still arrive as this point if user deleted noises since last start
         if self.current > self.max:
             self.current = 0
 
         if save_current_filename:
-            new_index = [self.noises.index(x) for x in self.noises if x[1] == save_current_filename]
-            if new_index:
-                self.current = new_index[0]
+            new_index = self.noises.index(save_current_filename)
+            if new_index >= 0:
+                self.current = new_index
                 self._set_cfg_current()
 
+        if self.on_changed is not None:
+            self.on_changed()
+
     def get_current_index(self):
         """Get current sound index in tracklist"""
         return self.current
@@ -162,53 +449,107 @@ class Noise:
 
     def get_current_filename_uri(self):
         """Get current sound filename as a file:// uri"""
-        return ''.join(['file://', self.get_current_filename()])
+        return self.get_filename_uri(self.current)
+
+    def get_filename_uri(self, index):
+        """Sound filename in the tracklist as a file:// uri"""
+        filename = self.noises[index][1]
+        if is_generated(filename) or archive.is_archived(filename):
+            return 'appsrc://'
+        return ''.join(['file://', filename])
+
+    def set_current(self, index):
+        """Jump to a sound of the tracklist"""
+        if 0 <= index <= self.max:
+            self.current = index
+            self._set_cfg_current()
 
     def set_next(self):
         """Next sound filename"""
-        self.current = self.current + 1
-        if self.current > self.max:
-            self.current = 0
-        self._set_cfg_current()
+        self._step(1)
 
     def set_previous(self):
         """Previous sound filename"""
-        self.current = self.current - 1
-        if self.current < 0:
-            self.current = self.max
+        self._step(-1)
+
+    def _step(self, step):
+        self.current = self._find(step)
         self._set_cfg_current()
 
+    def _find(self, step):
+        # Skip broken files, but stay in the same one if every other one is broken
+        current = self.current
+        for i in range(self.max + 1):
+            current = current + step
+            if current > self.max:
+                current = 0
+            if current < 0:
+                current = self.max
+            if self.is_playable(current):
+                break
+        return current
+
+    def get_neighbour_filenames(self):
+        """Filenames that next and previous would play"""
+        return [self.noises[self._find(1)][1], self.noises[self._find(-1)][1]]
+
+    def get_pack(self, index):
+        """Pack of a sound: the subfolder of a sound path it came in, None for loose sounds"""
+        filename = self.noises[index][1]
+        if archive.is_archived(filename):
+            return archive.get_pack(filename)
+        for sound_path in self.SOUND_PATHS:
+            if filename.startswith(os.path.join(sound_path, '')):
+                relative = filename[len(sound_path) + 1:]
+                if os.sep in relative:
+                    return relative.split(os.sep, 1)[0]
+        return None
+
+    def get_packs(self):
+        """Indexes of the sounds grouped by pack, loose sounds under None"""
+        packs = {}
+        for index in range(len(self.noises)):
+            packs.setdefault(self.get_pack(index), []).append(index)
+        return packs
+
     def get_name(self, noise=None):
         """Title for sound indicator"""
         if noise == None:
-            filename = self.noises[self.current][0]
+            return self.noises[self.current][0]
+        return _(self._get_title(noise))
+
+    def _get_title(self, noise):
+        filename = os.path.basename(os.path.splitext(noise)[0])
+        filename = filename.replace('_', ' ')
+        filename = filename.replace('-', ' ')
+        filename = filename.replace('.', '\n')
+        filename = filename.title()
+        return filename
+
+    def get_icon_uri(self, index=None):
+        """Get current (or any) sound thumbnail icon as a file:// uri"""
+        if index is None:
+            index = self.current
+        row = self.catalog.get(self.noises[index][1])
+        if row is not None and row['icon']:
+            filename = row['icon']
         else:
-            filename = os.path.basename(os.path.splitext(noise)[0])
-            filename = filename.replace('_', ' ')
-            filename = filename.replace('-', ' ')
-            filename = filename.replace('.', '\n')
-            filename = filename.title()
-        return _(filename)
-
-    def get_icon_uri(self):
-        """Get current sound thumbnail icon as a file:// uri"""
-        filename = os.path.splitext(self.get_current_filename())[0]
-        filename = '.'.join([filename, 'png'])
-        if not os.path.exists(filename):
-            filename = self.BASE_ICON
+            filename = self._get_base_icon()
 
         return ''.join(['file://', filename])
 
-    def _get_cfg_last(self):
-        current = 0
-        try:
-            with open (self.CFG_FILE, "r") as myfile:
-                current=int(myfile.readlines()[0])
-        except:
-            pass
-        return current
+    def _get_base_icon(self):
+        if self.BASE_ICON is None and 'gi.repository.Gtk' not in sys.modules:
+            # Headless: not worth loading GTK only for an icon
+            self.BASE_ICON = '/usr/share/icons/hicolor/48x48/apps/anoise.png'
+        if self.BASE_ICON is None:
+            try:
+                from gi.repository import Gtk
+                self.BASE_ICON = Gtk.IconTheme.get_default().lookup_icon('anoise', 48, 0).get_filename()
+            except:
+                self.BASE_ICON = ''
+        return self.BASE_ICON
 
     def _set_cfg_current(self):
-        cfg_file = open(self.CFG_FILE, "w")
-        cfg_file.write(str(self.current))
-        cfg_file.close()
+        # No disk access here, the state store writes it a bit later
+        self.state.set(current=self.current, current_filename=self.noises[self.current][1])
@@ -0,0 +1,775 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ANoise 0.0.29 (Ambient Noise)
+# Copyright (C) 2015 Marcos Alvarez Costales https://launchpad.net/~costales
+#
+# ANoise is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# ANoise is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ANoise; if not, see http://www.gnu.org/licenses
+# for more information.
+
+"""Benchmarks for ANoise, run from the source tree: python3 tools/bench.py <name>|all
+
+Every benchmark runs in a scratch HOME/XDG tree (and its own private session
+bus when it needs D-Bus) and prints its results as JSON, 'all' runs each one
+in its own process and can save them with --output to compare over time.
+"""
+
+import os, sys, json, time, wave, shutil, socket, tempfile, argparse, threading, subprocess
+
+ANOISE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'anoise')
+BENCHMARKS = {}
+
+
+def benchmark(function):
+    """Register a benchmark under its function name"""
+    BENCHMARKS[function.__name__] = function
+    return function
+
+
+def scratch_home():
+    """Point HOME and XDG to a temporary tree, before any ANoise module is imported"""
+    home = tempfile.mkdtemp(prefix='anoise-bench-')
+    os.environ['HOME'] = home
+    for name in ('XDG_CONFIG_HOME', 'XDG_DATA_HOME', 'XDG_CACHE_HOME'):
+        os.environ[name] = os.path.join(home, name.lower())
+    sys.path.insert(0, ANOISE_DIR)
+    return home
+
+
+def make_sounds(directory, count, prefix='noise'):
+    """Empty files with a sound extension, the listing doesn't read them"""
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    filenames = []
+    for i in range(count):
+        filename = os.path.join(directory, '%s_%05d.ogg' % (prefix, i))
+        open(filename, 'w').close()
+        filenames.append(filename)
+    return filenames
+
+
+def make_wavs(directory, count, seconds=0.5, rate=48000):
+    """Small valid (silent) sound files"""
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    frames = b'\0\0\0\0' * int(seconds * rate)
+    filenames = []
+    for i in range(count):
+        filename = os.path.join(directory, 'noise_%05d.wav' % i)
+        wav = wave.open(filename, 'wb')
+        wav.setnchannels(2)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(frames)
+        wav.close()
+        filenames.append(filename)
+    return filenames
+
+
+def init_gst():
+    import gi
+    gi.require_version('Gst', '1.0')
+    from gi.repository import Gst
+    Gst.init(None)
+
+
+def quiet_prober(hashing=False):
+    """Stand-in for the Discoverer, loudness and hashing pools, so listing benchmarks don't measure them"""
+    import probe, loudness, hasher
+    probe.Prober.probe = lambda self, filenames: None
+    loudness.Loudness.analyze = lambda self, filenames: None
+    if not hashing:
+        hasher.Hasher.hash = lambda self, filenames: None
+
+
+def private_session_bus():
+    """Start a dbus-daemon only for this benchmark, it goes away with the process"""
+    daemon = subprocess.Popen(['dbus-daemon', '--session', '--nofork', '--print-address=1'],
+                              stdout=subprocess.PIPE, universal_newlines=True)
+    os.environ['DBUS_SESSION_BUS_ADDRESS'] = daemon.stdout.readline().strip()
+    return daemon
+
+
+def run_main_loop_until(condition, timeout):
+    """Iterate the default GLib main context until condition() or timeout seconds"""
+    from gi.repository import GLib
+    context = GLib.MainContext.default()
+    end = time.monotonic() + timeout
+    while not condition() and time.monotonic() < end:
+        context.iteration(False)
+        time.sleep(0.001)
+
+
+@benchmark
+def watcher(args):
+    """Copy a pack of files, then move a folder of them, into a watched path: refreshes and CPU it costs"""
+    home = scratch_home()
+    make_sounds(os.path.join(home, 'ANoise'), 1)
+    init_gst()
+    quiet_prober()
+    from utils import Noise
+
+    noise = Noise()
+    listed = len(noise.noises) # The first file, and the generated noises when NumPy is there
+    pack = make_sounds(os.path.join(home, 'pack'), args.files, 'pack')
+    cpu = time.process_time()
+    start = time.monotonic()
+    for filename in pack:
+        shutil.copy(filename, os.path.join(home, 'ANoise'))
+    run_main_loop_until(lambda: len(noise.noises) == listed + args.files, args.timeout)
+    result = {
+        'files': args.files,
+        'listed': len(noise.noises) - listed,
+        'refreshes': noise.PATH_WATCHER.refreshes,
+        'cpu_seconds': time.process_time() - cpu,
+        'wall_seconds': time.monotonic() - start,
+    }
+
+    # A whole folder moved in: one directory event, none for the files in it
+    listed = len(noise.noises)
+    refreshes = noise.PATH_WATCHER.refreshes
+    make_sounds(os.path.join(home, 'folder'), args.files, 'folder')
+    cpu = time.process_time()
+    start = time.monotonic()
+    os.rename(os.path.join(home, 'folder'), os.path.join(home, 'ANoise', 'folder'))
+    run_main_loop_until(lambda: len(noise.noises) == listed + args.files, args.timeout)
+    result['folder'] = {
+        'listed': len(noise.noises) - listed,
+        'refreshes': noise.PATH_WATCHER.refreshes - refreshes,
+        'cpu_seconds': time.process_time() - cpu,
+        'wall_seconds': time.monotonic() - start,
+    }
+    noise.PATH_OBSERVER.stop()
+    if result['folder']['listed'] != args.files:
+        raise RuntimeError('%d of the %d files in a moved folder listed' % (result['folder']['listed'], args.files))
+    return result
+
+
+@benchmark
+def probe(args):
+    """Probe a library of valid files with the Discoverer pool"""
+    home = scratch_home()
+    filenames = make_wavs(os.path.join(home, 'library'), args.probe_files)
+    init_gst()
+    from probe import Prober
+
+    results = {}
+    prober = Prober(lambda filename, info: results.__setitem__(filename, info))
+    cpu = time.process_time()
+    start = time.monotonic()
+    prober.probe(filenames)
+    run_main_loop_until(lambda: len(results) == len(filenames), args.timeout)
+    wall = time.monotonic() - start
+    return {
+        'files': len(filenames),
+        'probed': len(results),
+        'valid': sum(1 for info in results.values() if info['valid']),
+        'cpu_seconds': time.process_time() - cpu,
+        'wall_seconds': wall,
+        'files_per_second': len(results) / wall if wall else None,
+    }
+
+
+@benchmark
+def dedup(args):
+    """Hash a library that is installed twice, until every copy is listed once"""
+    home = scratch_home()
+    library = os.path.join(home, 'ANoise')
+    os.makedirs(library)
+    for i in range(args.files):
+        with open(os.path.join(library, 'noise_%05d.ogg' % i), 'wb') as sound_file:
+            sound_file.write(os.urandom(256 * 1024))
+    shutil.copytree(library, os.path.join(home, '.ANoise'))
+    init_gst()
+    quiet_prober(hashing=True)
+    from utils import Noise
+
+    cpu = time.process_time()
+    start = time.monotonic()
+    noise = Noise(watch=False)
+    listed = len(noise.noises)
+    run_main_loop_until(lambda: not noise.hasher.is_busy(), args.timeout)
+    wall = time.monotonic() - start
+    hashed = 2 * args.files * 256 * 1024
+    return {
+        'files': 2 * args.files,
+        'listed_before': listed,
+        'listed_after': len(noise.noises),
+        'cpu_seconds': time.process_time() - cpu,
+        'wall_seconds': wall,
+        'mb_per_second': hashed / wall / 1e6 if wall else None,
+    }
+
+
+@benchmark
+def generators(args):
+    """Generated frames per second on one core, for every color"""
+    sys.path.insert(0, ANOISE_DIR)
+    from generators import ColoredNoise, COLORS, RATE
+
+    result = {}
+    for color in COLORS:
+        generator = ColoredNoise(color)
+        frames = 0
+        cpu = time.process_time()
+        while time.process_time() - cpu < args.seconds:
+            generator.generate(args.block)
+            frames += args.block
+        cpu = time.process_time() - cpu
+        result[color] = {
+            'frames_per_second': frames / cpu,
+            'cpu_percent_realtime': 100.0 * RATE / (frames / cpu),
+        }
+    return result
+
+
+@benchmark
+def refresh(args):
+    """Full Noise.refresh_sound_files on a big library: first scan, unchanged and changed"""
+    home = scratch_home()
+    library = os.path.join(home, 'ANoise')
+    make_sounds(library, args.library)
+    init_gst()
+    quiet_prober()
+    from utils import Noise
+
+    start = time.monotonic()
+    noise = Noise(watch=False) # Scans an empty catalog
+    cold = time.monotonic() - start
+
+    start = time.monotonic()
+    noise.refresh_sound_files()
+    unchanged = time.monotonic() - start
+
+    make_sounds(library, 1, 'new')
+    start = time.monotonic()
+    noise.refresh_sound_files()
+    changed = time.monotonic() - start
+    return {
+        'files': len(noise.noises),
+        'cold_seconds': cold,
+        'unchanged_seconds': unchanged,
+        'changed_seconds': changed,
+    }
+
+
+@benchmark
+def tree(args):
+    """Recursive refresh of nested packs: --library files in --dirs directories, two levels deep"""
+    home = scratch_home()
+    library = os.path.join(home, 'ANoise')
+    packs = max(1, args.dirs // 10)
+    dirs = []
+    for pack in range(packs):
+        for part in range(args.dirs // packs):
+            dirs.append(os.path.join(library, 'pack_%03d' % pack, 'part_%02d' % part))
+    for directory in dirs:
+        make_sounds(directory, args.library // len(dirs))
+    init_gst()
+    quiet_prober()
+    from utils import Noise
+
+    start = time.monotonic()
+    noise = Noise(watch=False)
+    cold = time.monotonic() - start
+
+    start = time.monotonic()
+    noise.refresh_sound_files()
+    unchanged = time.monotonic() - start
+
+    make_sounds(dirs[len(dirs) // 2], 1, 'new') # One deep directory changed
+    start = time.monotonic()
+    noise.refresh_sound_files()
+    changed = time.monotonic() - start
+    return {
+        'files': len(noise.noises),
+        'dirs': len(dirs) + packs + 1,
+        'packs': len(noise.get_packs()),
+        'cold_seconds': cold,
+        'unchanged_seconds': unchanged,
+        'one_dir_changed_seconds': changed,
+    }
+
+
+@benchmark
+def skip(args):
+    """set_next/set_previous throughput"""
+    home = scratch_home()
+    make_sounds(os.path.join(home, 'ANoise'), args.files)
+    init_gst()
+    quiet_prober()
+    from utils import Noise
+
+    noise = Noise(watch=False)
+    result = {}
+    for name, step in (('set_next', noise.set_next), ('set_previous', noise.set_previous)):
+        start = time.monotonic()
+        for i in range(args.iterations):
+            step()
+        result[name + '_per_second'] = args.iterations / (time.monotonic() - start)
+    return result
+
+
+@benchmark
+def song_changed(args):
+    """Cost of SoundMenuControls.song_changed, and the signals a listener gets"""
+    scratch_home()
+    daemon = private_session_bus()
+    try:
+        import dbus
+        from dbus.mainloop.glib import DBusGMainLoop
+        DBusGMainLoop(set_as_default=True)
+        from sound_menu import SoundMenuControls
+
+        from gi.repository import GLib
+        context = GLib.MainContext.default()
+        sound_menu = SoundMenuControls('Ambient Noise', 'anoise')
+        received = []
+        listener = dbus.bus.BusConnection(os.environ['DBUS_SESSION_BUS_ADDRESS'])
+        listener.add_signal_receiver(lambda *signal: received.append(signal), 'PropertiesChanged',
+                                     dbus.PROPERTIES_IFACE, path='/org/mpris/MediaPlayer2')
+        run_main_loop_until(lambda: False, 0.2)
+        del received[:]
+
+        start = time.monotonic()
+        for i in range(args.iterations):
+            sound_menu.song_changed(i % 100, '', '', 'Noise %d' % i, 'file:///icon.png', 'file:///noise.ogg')
+            sound_menu.signal_playing()
+            context.iteration(False) # One main loop iteration per skip, as between two key presses
+        elapsed = time.monotonic() - start
+        run_main_loop_until(lambda: False, 0.5)
+        return {
+            'skips': args.iterations,
+            'microseconds_per_skip': 1e6 * elapsed / args.iterations,
+            'signals_received': len(received),
+            'signals_per_skip': float(len(received)) / args.iterations,
+        }
+    finally:
+        daemon.terminate()
+        daemon.wait()
+
+
+@benchmark
+def play_pause(args):
+    """Play/pause state change latency of a playbin like ANoise's, on a fakesink"""
+    home = scratch_home()
+    filename = make_wavs(os.path.join(home, 'ANoise'), 1, seconds=5)[0]
+    init_gst()
+    from gi.repository import Gst
+
+    player = Gst.ElementFactory.make('playbin', None)
+    sink = Gst.ElementFactory.make('fakesink', None)
+    sink.set_property('sync', True)
+    player.set_property('audio-sink', sink)
+    player.set_property('audio-filter', Gst.ElementFactory.make('volume', None))
+    player.set_property('uri', Gst.filename_to_uri(filename))
+
+    def change(state):
+        start = time.monotonic()
+        player.set_state(state)
+        player.get_state(Gst.CLOCK_TIME_NONE)
+        return time.monotonic() - start
+
+    preroll = change(Gst.State.PAUSED)
+    plays, pauses = [], []
+    for i in range(args.iterations):
+        plays.append(change(Gst.State.PLAYING))
+        pauses.append(change(Gst.State.PAUSED))
+    player.set_state(Gst.State.NULL)
+    return {
+        'preroll_ms': 1000 * preroll,
+        'play_ms_mean': 1000 * sum(plays) / len(plays),
+        'play_ms_max': 1000 * max(plays),
+        'pause_ms_mean': 1000 * sum(pauses) / len(pauses),
+        'pause_ms_max': 1000 * max(pauses),
+    }
+
+
+@benchmark
+def loop(args):
+    """Loop a short sound through ANoise's own player: the file is opened and decoded once for all loops"""
+    home = scratch_home()
+    filename = make_wavs(os.path.join(home, 'ANoise'), 1, seconds=0.2)[0]
+    daemon = private_session_bus()
+    try:
+        init_gst()
+        quiet_prober()
+        from gi.repository import Gst
+        from anoise import ANoise
+
+        anoise = ANoise(headless=True) # Plays its current noise as soon as the main loop runs
+        anoise.noise.set_current(anoise.noise.noises.index(filename)) # Not a generated noise
+        sink = Gst.ElementFactory.make('fakesink', None)
+        sink.set_property('sync', False) # As fast as it decodes, it's the loops that are counted
+        anoise.player.set_property('audio-sink', sink)
+        counts = {'sources': 0, 'decoders': 0}
+
+        def on_element(bin, sub_bin, element):
+            klass = element.get_factory().get_metadata('klass') if element.get_factory() else ''
+            if 'Decoder' in klass or 'Demuxer' in klass: # wavparse demuxes, compressed sounds decode too
+                counts['decoders'] += 1
+
+        anoise.player.connect('source-setup', lambda player, source: counts.__setitem__('sources', counts['sources'] + 1))
+        anoise.player.connect('deep-element-added', on_element)
+        start = time.monotonic()
+        run_main_loop_until(lambda: anoise.stats.get()['loops'] >= args.iterations, args.timeout)
+        wall = time.monotonic() - start
+        loops = anoise.stats.get()['loops']
+        anoise.player.set_state(Gst.State.NULL)
+        if anoise.noise.PATH_OBSERVER is not None:
+            anoise.noise.PATH_OBSERVER.stop()
+    finally:
+        daemon.terminate()
+        daemon.wait()
+
+    # Not asserts, python -O would skip them
+    if loops < args.iterations:
+        raise RuntimeError('only %d loops of %d' % (loops, args.iterations))
+    if counts['sources'] != 1:
+        raise RuntimeError('the file was opened %d times' % counts['sources'])
+    if counts['decoders'] != 1:
+        raise RuntimeError('%d decoders were made' % counts['decoders'])
+    return {
+        'loops': loops,
+        'file_opens': counts['sources'],
+        'decoders': counts['decoders'],
+        'loops_per_second': loops / wall if wall else None,
+    }
+
+
+def get_playback_status(bus):
+    """MPRIS PlaybackStatus of a running ANoise, None while it isn't on the bus"""
+    import dbus
+    try:
+        player = bus.get_object('org.mpris.MediaPlayer2.anoise', '/org/mpris/MediaPlayer2')
+        return player.Get('org.mpris.MediaPlayer2.Player', 'PlaybackStatus', dbus_interface=dbus.PROPERTIES_IFACE)
+    except dbus.exceptions.DBusException:
+        return None
+
+
+def launch(arguments, env, timeout=30, trace_wait=2):
+    """Start ANoise on the session bus in env, returns it with the seconds until it was 'playing' and
+    until its first audio (each None if it didn't come in the timeout)
+
+    Playing is polled from outside over MPRIS, so every revision can be timed and compared;
+    the first audio is only known from the revisions that trace it (ANOISE_TRACE_STARTUP).
+    """
+    import dbus
+    bus = dbus.bus.BusConnection(env['DBUS_SESSION_BUS_ADDRESS'])
+    started = time.monotonic()
+    process = subprocess.Popen([sys.executable, os.path.join(ANOISE_DIR, 'anoise.py')] + arguments,
+                               env=env, stderr=subprocess.PIPE, universal_newlines=True)
+    first_audio = []
+
+    def read_trace():
+        for line in process.stderr:
+            if line.startswith('anoise: first audio at '):
+                first_audio.append(float(line.split()[-1]) - started)
+
+    reader = threading.Thread(target=read_trace)
+    reader.daemon = True
+    reader.start()
+    times = {'playing': None, 'first_audio': None}
+    end = started + timeout
+    while time.monotonic() < end and process.poll() is None and not first_audio:
+        if times['playing'] is None and get_playback_status(bus) == 'Playing':
+            times['playing'] = time.monotonic() - started
+            end = min(end, time.monotonic() + trace_wait) # Older revisions never trace it
+        time.sleep(0.005)
+    if first_audio:
+        times['first_audio'] = first_audio[0]
+    bus.close()
+    return process, times
+
+
+def get_rss(pid):
+    """Resident memory of a process, in KiB"""
+    with open('/proc/%d/status' % pid) as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return None
+
+
+LISTENER = """
+import sys, time, socket
+client = socket.create_connection(('127.0.0.1', int(sys.argv[1])))
+client.settimeout(5)
+client.sendall(b'GET / HTTP/1.0\\r\\n\\r\\n')
+received, end = 0, time.monotonic() + float(sys.argv[2])
+while time.monotonic() < end:
+    if sys.argv[3] == 'slow':
+        time.sleep(0.1) # Never reads: the server has to bound what it keeps for it
+        continue
+    try:
+        data = client.recv(65536)
+    except socket.timeout:
+        break
+    if not data:
+        break
+    received += len(data)
+print(received)
+"""
+
+
+@benchmark
+def stream(args):
+    """Encode cost of the stream server with one listener and with many, plus a stalled one"""
+    scratch_home()
+    init_gst()
+    from gi.repository import Gst
+    from stream import StreamServer, make_audio_sink
+
+    probe = socket.socket()
+    probe.bind(('127.0.0.1', 0))
+    port = probe.getsockname()[1]
+    probe.close()
+    server = StreamServer(port)
+    server.start()
+    pipeline = Gst.Pipeline.new(None)
+    source = Gst.ElementFactory.make('audiotestsrc', None)
+    source.set_property('is-live', True)
+    source.set_property('wave', 'pink-noise')
+    sink = make_audio_sink(server, local=False)
+    pipeline.add(source)
+    pipeline.add(sink)
+    source.link(sink)
+    pipeline.set_state(Gst.State.PLAYING)
+
+    def listen(count, slow=0):
+        listeners = [subprocess.Popen([sys.executable, '-c', LISTENER, str(port), str(args.seconds), 'fast'],
+                                      stdout=subprocess.PIPE, universal_newlines=True) for i in range(count)]
+        listeners += [subprocess.Popen([sys.executable, '-c', LISTENER, str(port), str(args.seconds), 'slow'],
+                                       stdout=subprocess.PIPE, universal_newlines=True) for i in range(slow)]
+        cpu = time.process_time()
+        run_main_loop_until(lambda: all(listener.poll() is not None for listener in listeners), args.seconds + 5)
+        cpu = time.process_time() - cpu
+        received = [int(listener.communicate()[0] or 0) for listener in listeners[:count]]
+        return {
+            'listeners': count,
+            'stalled_listeners': slow,
+            'cpu_percent': 100.0 * cpu / args.seconds,
+            'min_bytes_per_second': min(received) / args.seconds,
+        }
+
+    try:
+        result = {'one': listen(1), 'many': listen(args.clients, slow=1)}
+        result['clients_left'] = server.get_clients()
+        return result
+    finally:
+        pipeline.set_state(Gst.State.NULL)
+        server.stop()
+
+
+@benchmark
+def preferences(args):
+    """Open the preferences with and without a running sleep timer (it needs a display)"""
+    scratch_home()
+    import gi
+    gi.require_version('Gtk', '3.0')
+    from gi.repository import Gtk
+    from preferences import Preferences
+
+    class Player:
+        """What the preferences use of ANoise: its sleep timer and its noises"""
+        def __init__(self, sleep_at):
+            self.sleep_at = sleep_at
+            self.noise = None
+
+        def get_sleep_at(self):
+            return self.sleep_at
+
+        def set_timer(self, activate, seconds):
+            self.sleep_at = time.time() + seconds if activate else None
+
+    result = {}
+    for name, sleep_at in (('no_timer', None), ('timer', time.time() + 600)):
+        player = Player(sleep_at)
+        start = time.monotonic()
+        window = Preferences(player)
+        result[name] = {'open_seconds': time.monotonic() - start}
+        if window.cb_sleep.get_active() != (sleep_at is not None):
+            raise RuntimeError('%s: the sleep check box doesn\'t show the timer' % name)
+        window.cb_sleep.set_active(sleep_at is None) # Now the user toggles it
+        if (player.sleep_at is None) != (sleep_at is not None):
+            raise RuntimeError('%s: toggling the check box didn\'t change the timer' % name)
+        window.win_preferences.destroy()
+        while Gtk.events_pending():
+            Gtk.main_iteration()
+    return result
+
+
+@benchmark
+def startup(args):
+    """Time from launching ANoise to playing and to its first audio
+
+    Check out the old revision and run it there too to compare: playing is measured
+    from outside over MPRIS, so it works on revisions that don't trace their first audio.
+    """
+    home = scratch_home()
+    make_wavs(os.path.join(home, 'ANoise'), 1, seconds=5)
+    daemon = private_session_bus()
+    env = dict(os.environ, ANOISE_TRACE_STARTUP='1')
+
+    measured = {'playing': [], 'first_audio': []}
+    try:
+        for i in range(args.runs):
+            process, times = launch(['--daemon'] if args.daemon else [], env, args.timeout)
+            process.terminate()
+            process.wait()
+            for name, seconds in times.items():
+                if seconds is not None:
+                    measured[name].append(seconds)
+    finally:
+        daemon.terminate()
+        daemon.wait()
+    result = {'runs': args.runs}
+    for name, times in measured.items():
+        times.sort()
+        result[name] = {
+            'measured': len(times),
+            'min_seconds': times[0] if times else None,
+            'median_seconds': times[len(times) // 2] if times else None,
+        }
+    return result
+
+
+@benchmark
+def memory(args):
+    """Resident memory of the full app and of the headless daemon, once they play"""
+    home = scratch_home()
+    make_wavs(os.path.join(home, 'ANoise'), 1, seconds=5)
+    daemon = private_session_bus()
+    env = dict(os.environ, ANOISE_TRACE_STARTUP='1')
+    result = {}
+    try:
+        for name, arguments in (('app', []), ('daemon', ['--daemon'])):
+            process, times = launch(arguments, env, args.timeout)
+            time.sleep(1) # Let the deferred work after the first audio run too
+            result[name] = {
+                'startup_seconds': times['first_audio'],
+                'rss_kib': get_rss(process.pid) if process.poll() is None else None,
+            }
+            process.terminate()
+            process.wait()
+    finally:
+        daemon.terminate()
+        daemon.wait()
+    if result['app']['rss_kib'] and result['daemon']['rss_kib']:
+        result['daemon_saves_kib'] = result['app']['rss_kib'] - result['daemon']['rss_kib']
+    return result
+
+
+def get_process_counters(pid):
+    """CPU seconds and context switches (every thread) of a process"""
+    with open('/proc/%d/stat' % pid) as stat:
+        fields = stat.read().rsplit(')', 1)[1].split()
+    cpu = (int(fields[11]) + int(fields[12])) / float(os.sysconf('SC_CLK_TCK')) # utime + stime
+    switches = 0
+    for task in os.listdir('/proc/%d/task' % pid):
+        try:
+            with open('/proc/%d/task/%s/status' % (pid, task)) as status:
+                for line in status:
+                    if line.startswith(('voluntary_ctxt_switches:', 'nonvoluntary_ctxt_switches:')):
+                        switches += int(line.split()[1])
+        except (IOError, OSError):
+            pass # That thread is gone
+    return cpu, switches
+
+
+@benchmark
+def power(args):
+    """Wakeups per second and CPU time per hour of playback, for every power profile, on the player and the mixer"""
+    home = scratch_home()
+    make_wavs(os.path.join(home, 'ANoise'), 1, seconds=30)
+    daemon = private_session_bus()
+    sys.path.insert(0, ANOISE_DIR)
+    import power, dbus
+    from sound_menu import CONTROL_IFACE
+    env = dict(os.environ, ANOISE_TRACE_STARTUP='1')
+    result = {}
+    try:
+        for profile, path in [(profile, path) for profile in sorted(power.PROFILES) for path in ('player', 'mixer')]:
+            name = '%s_%s' % (profile, path)
+            process, times = launch(['--daemon', '--power-profile', profile], env, args.timeout)
+            if times['first_audio'] is None:
+                process.terminate()
+                process.wait()
+                result[name] = {'error': 'no audio'}
+                continue
+            if path == 'mixer':
+                # A crossfade time moves the noise to the mixer pipeline, as layers do
+                bus = dbus.bus.BusConnection(env['DBUS_SESSION_BUS_ADDRESS'])
+                bus.get_object('org.mpris.MediaPlayer2.anoise', '/org/mpris/MediaPlayer2').SetCrossfade(
+                    1.0, dbus_interface=CONTROL_IFACE)
+                bus.close()
+            time.sleep(2) # The work deferred after the first audio isn't playback
+            cpu, switches = get_process_counters(process.pid)
+            time.sleep(args.seconds)
+            cpu_end, switches_end = get_process_counters(process.pid)
+            process.terminate()
+            process.wait()
+            result[name] = {
+                'wakeups_per_second': (switches_end - switches) / args.seconds,
+                'cpu_seconds_per_hour': 3600 * (cpu_end - cpu) / args.seconds,
+            }
+    finally:
+        daemon.terminate()
+        daemon.wait()
+    return result
+
+
+def run_all(args):
+    """Every benchmark but the ones running ANoise itself (they need audio) or a window, each in its own process"""
+    results = {}
+    for name in sorted(BENCHMARKS):
+        if name in ('startup', 'memory', 'power', 'preferences'):
+            continue
+        command = [sys.executable, os.path.abspath(__file__), name] + ['--%s=%s' % (option.replace('_', '-'), getattr(args, option))
+            for option in ('library', 'dirs', 'iterations', 'files', 'probe_files', 'timeout', 'seconds', 'block', 'clients')]
+        try:
+            results.update(json.loads(subprocess.check_output(command, universal_newlines=True)))
+        except (subprocess.CalledProcessError, ValueError) as error:
+            results[name] = {'error': str(error)}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ANoise benchmarks')
+    parser.add_argument('name', choices=sorted(BENCHMARKS) + ['all'])
+    parser.add_argument('--output', help='also write the JSON results to this file')
+    parser.add_argument('--library', type=int, default=10000)
+    parser.add_argument('--dirs', type=int, default=200)
+    parser.add_argument('--iterations', type=int, default=1000)
+    parser.add_argument('--files', type=int, default=500)
+    parser.add_argument('--probe-files', type=int, default=1000, help='library size of the probe benchmark')
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--seconds', type=float, default=2)
+    parser.add_argument('--block', type=int, default=4096)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--daemon', action='store_true', help='time the headless daemon in startup')
+    args = parser.parse_args()
+    if args.name == 'all':
+        results = run_all(args)
+    else:
+        results = {args.name: BENCHMARKS[args.name](args)}
+    results = json.dumps(results, indent=2, sort_keys=True)
+    print(results)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(results)
+
+
+if __name__ == "__main__":
+    main()